@@ -4,11 +4,7 @@ from shapely.geometry import Point
 import json
 import os
 import folium
-from pathlib import Path
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import time
-import base64
+from map_screenshots import ScreenshotService, save_map_screenshot
 
 
 def site_import(file_path, parameter=None):
@@ -691,71 +687,6 @@ def create_filtered_isp_map(sites_gdf, wtd_service_area, wtd_basins):
     folium.LayerControl(collapsed=False, show=False).add_to(m)
     
     return m
-def save_map_screenshot(html_path, output_path, pdf_path, window_size=(729, 943)):
-    """Save map as static PNG screenshot"""
-    
-    # Read original HTML
-    with open(html_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Create static version
-    static_code = """
-    <style>
-    .leaflet-container {
-        cursor: default !important;
-        pointer-events: none !important;
-    }
-    .leaflet-control-zoom,
-    .leaflet-control-attribution,
-    .leaflet-control-layers {
-        display: none !important;
-    }
-    </style>
-    </head>
-    """
-    
-    static_html = html_content.replace('</head>', static_code)
-    
-    # Save static version to temporary file
-    static_html_path = html_path.replace('.html', '_static.html')
-    with open(static_html_path, 'w', encoding='utf-8') as f:
-        f.write(static_html)
-    
-    # Take screenshot of static version
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--disable-gpu')
-    chrome_options.add_argument(f'--window-size={window_size[0]},{window_size[1]}')
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    html_uri = Path(static_html_path).resolve().as_uri()
-    driver.get(html_uri)
-    time.sleep(2)
-    driver.save_screenshot(output_path)
-  
-
-    
-
-    # Wait for page to render (optional)
-    time.sleep(2)
-
-    # Use Chrome DevTools Protocol (CDP) to print to PDF
-    pdf = driver.execute_cdp_cmd("Page.printToPDF", {
-        "printBackground": True,
-        "landscape": False
-    })
-
-    # Save the base64-encoded PDF data to file
-    with open(pdf_path, "wb") as f:
-        f.write(base64.b64decode(pdf['data']))
-
-    driver.quit()
-
-   
-    # Optionally remove temporary static file
-    # os.remove(static_html_path)
-
-
 # Main execution
 if __name__ == "__main__":
     # Import data
@@ -779,38 +710,44 @@ if __name__ == "__main__":
     ]
     sites_gdf[output_cols].to_csv("WTD_MAP/data/WTD_LTM_Gages_Modified.csv", index=False)
     
-    # Save screenshot
-    save_map_screenshot(
-        html_path='WTD_map/data/wtd_map.html',
-        output_path='WTD_map/data/wtd_map.png',
-        pdf_path='WTD_map/data/wtd_map.pdf',
-        window_size=(729, 943)
-    )
-    
-    # remove wtd basins from mapping
-    basins_filter = None
-    # Create filtered and save map
-    m = create_filtered_map(sites_gdf, wtd_service_area, basins_filter)
-    m.save("WTD_map/data/wtd_map_filtered.html")
-
-    # Save screenshot
-    save_map_screenshot(
-        html_path='WTD_map/data/wtd_map_filtered.html',
-        output_path='WTD_map/data/wtd_map_filtered.png',
-        pdf_path='WTD_map/data/wtd_map_filtered.pdf',
-        window_size=(729, 943)
-    )
-
-    ### create filterd isp map
-    m = create_filtered_isp_map(sites_gdf, wtd_service_area, basins_filter)
-    m.save("WTD_map/data/wtd_map_filtered_isp.html")
-
-    # Save screenshot
-    save_map_screenshot(
-        html_path='WTD_map/data/wtd_map_filtered_isp.html',
-        output_path='WTD_map/data/wtd_map_filtered_isp.png',
-        pdf_path='WTD_map/data/wtd_map_filtered_isp.pdf',
-        window_size=(729, 943)
-    )
+    # one warm browser for all three screenshots
+    with ScreenshotService(window_size=(729, 943)) as screenshot_service:
+
+        # Save screenshot
+        save_map_screenshot(
+            html_path='WTD_map/data/wtd_map.html',
+            output_path='WTD_map/data/wtd_map.png',
+            pdf_path='WTD_map/data/wtd_map.pdf',
+            window_size=(729, 943),
+            service=screenshot_service
+        )
+    
+        # remove wtd basins from mapping
+        basins_filter = None
+        # Create filtered and save map
+        m = create_filtered_map(sites_gdf, wtd_service_area, basins_filter)
+        m.save("WTD_map/data/wtd_map_filtered.html")
+
+        # Save screenshot
+        save_map_screenshot(
+            html_path='WTD_map/data/wtd_map_filtered.html',
+            output_path='WTD_map/data/wtd_map_filtered.png',
+            pdf_path='WTD_map/data/wtd_map_filtered.pdf',
+            window_size=(729, 943),
+            service=screenshot_service
+        )
+
+        ### create filterd isp map
+        m = create_filtered_isp_map(sites_gdf, wtd_service_area, basins_filter)
+        m.save("WTD_map/data/wtd_map_filtered_isp.html")
+
+        # Save screenshot
+        save_map_screenshot(
+            html_path='WTD_map/data/wtd_map_filtered_isp.html',
+            output_path='WTD_map/data/wtd_map_filtered_isp.png',
+            pdf_path='WTD_map/data/wtd_map_filtered_isp.pdf',
+            window_size=(729, 943),
+            service=screenshot_service
+        )
     print("Map generation complete!")
     print(f"Sites processed: {len(sites_gdf)}")
\ No newline at end of file
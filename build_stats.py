@@ -0,0 +1,208 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import shapely
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+# default location of the per-run json reports
+REPORT_DIR = "data/build_reports"
+
+# the run being recorded in this process, see start_run
+_run = None
+
+
+def _rss_mb():
+    if psutil is None:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss / 1e6
+
+
+def _peak_rss_mb():
+    """process resident memory high-water mark, GDAL/GEOS/Arrow allocations included"""
+    if psutil is not None:
+        info = psutil.Process(os.getpid()).memory_info()
+        if hasattr(info, "peak_wset"):
+            return info.peak_wset / 1e6
+    if resource is not None:
+        # kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    return None
+
+
+class BuildRun:
+    """Stage timings and memory for one pipeline run, see start_run and stage"""
+
+    def __init__(self, name, track_memory=False):
+        self.name = name
+        self.track_memory = track_memory
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = []
+        self._open = []
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add(self, name, **fields):
+        """record a stage measured elsewhere (e.g. in a worker process)"""
+        entry = {"stage": "/".join([s.name for s in self._open] + [name])}
+        entry.update(fields)
+        self.stages.append(entry)
+        return entry
+
+    def report(self):
+        return {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "total_s": round(time.perf_counter() - self.start, 3),
+            "peak_rss_mb": round(max((s["peak_rss_mb"] for s in self.stages if s.get("peak_rss_mb")), default=0), 1) or None,
+            "stages": self.stages,
+        }
+
+
+class Stage:
+    """one open stage; count() attaches row/vertex counts of its output"""
+
+    def __init__(self, name):
+        self.name = name
+        self.info = {}
+        self.peak = 0
+
+    def count(self, gdf, label=None):
+        """record the rows (and vertices, for GeoDataFrames) of a stage output"""
+        prefix = f"{label}_" if label else ""
+        if gdf is None:
+            return gdf
+        self.info[f"{prefix}rows"] = int(len(gdf))
+        if hasattr(gdf, "geometry"):
+            self.info[f"{prefix}vertices"] = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+        return gdf
+
+
+def start_run(name, track_memory=False):
+    """Start recording stages for a pipeline run in this process and return it.
+
+    Every stage records the process RSS high-water mark (peak_rss_mb), which
+    includes memory allocated inside GDAL/GEOS/Arrow; a stage that raised it
+    shows a higher value than the stage before. track_memory also traces
+    Python allocations with tracemalloc for a per-stage peak_mb; that makes
+    pandas-heavy code several times slower and misses native allocations,
+    so only turn it on when hunting a Python-side leak.
+    """
+    global _run
+    _run = BuildRun(name, track_memory=track_memory)
+    return _run
+
+
+@contextmanager
+def stage(name, **info):
+    """Time a pipeline stage: wall and CPU seconds, RSS high-water mark, traced peak (track_memory) and output counts.
+
+    Stages nest ("create map/simplify"). Outside a run (no start_run, e.g.
+    in pool workers) nothing is recorded.
+    """
+    run = _run
+    current = Stage(name)
+    current.info.update(info)
+    if run is None:
+        yield current
+        return
+
+    tracing = run.track_memory and tracemalloc.is_tracing()
+    if tracing:
+        # close off the enclosing stage's peak before this one resets it
+        if run._open:
+            run._open[-1].peak = max(run._open[-1].peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    run._open.append(current)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield current
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        run._open.pop()
+        entry = run.add(name, wall_s=round(wall, 3), cpu_s=round(cpu, 3))
+        if tracing:
+            current.peak = max(current.peak, tracemalloc.get_traced_memory()[1])
+            entry["peak_mb"] = round(current.peak / 1e6, 1)
+            if run._open:
+                run._open[-1].peak = max(run._open[-1].peak, current.peak)
+            tracemalloc.reset_peak()
+        rss = _rss_mb()
+        if rss is not None:
+            entry["rss_mb"] = round(rss, 1)
+        peak_rss = _peak_rss_mb()
+        if peak_rss is not None:
+            entry["peak_rss_mb"] = round(peak_rss, 1)
+        entry.update(current.info)
+
+
+def record(name, gdf=None, **fields):
+    """Add a stage measured elsewhere (e.g. timed in a worker process) to the current run.
+
+    gdf adds its row/vertex counts. Does nothing outside a run.
+    """
+    if _run is None:
+        return None
+    counts = Stage(name)
+    counts.count(gdf)
+    return _run.add(name, **fields, **counts.info)
+
+
+def write_report(report_dir=REPORT_DIR):
+    """Write the current run as {report_dir}/{run}_{timestamp}.json and return its path"""
+    if _run is None:
+        return None
+    report = _run.report()
+    Path(report_dir).mkdir(parents=True, exist_ok=True)
+    report_path = Path(report_dir) / f"{_run.name}_{_run.started:%Y%m%d_%H%M%S}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    slowest = sorted(_run.stages, key=lambda s: s.get("wall_s", 0), reverse=True)[:5]
+    print(f"{_run.name}: {report['total_s']:.1f}s, slowest stages: "
+          + ", ".join(f"{s['stage']} {s.get('wall_s', 0):.1f}s" for s in slowest))
+    return report_path
+
+
+def compare_reports(previous_path, current_path, threshold=1.25, min_seconds=1.0):
+    """Print and return stages that got slower or hungrier than threshold times the previous run.
+
+    Stages taking under min_seconds in both runs are ignored as noise.
+    """
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {s["stage"]: s for s in json.load(f)["stages"]}
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)["stages"]
+
+    regressions = []
+    for entry in current:
+        old = previous.get(entry["stage"])
+        if old is None:
+            continue
+        for field in ("wall_s", "peak_rss_mb", "peak_mb"):
+            if field not in entry or not old.get(field):
+                continue
+            if field == "wall_s" and max(entry[field], old[field]) < min_seconds:
+                continue
+            if entry[field] > old[field] * threshold:
+                regressions.append({"stage": entry["stage"], "field": field,
+                                    "previous": old[field], "current": entry[field]})
+                print(f"{entry['stage']}: {field} {old[field]} -> {entry[field]}")
+    return regressions
@@ -0,0 +1,180 @@
+import json
+import time
+
+import numpy as np
+
+from map_screenshots import READY_SCRIPT, ScreenshotService
+
+# window.__benchmarkInteractions(steps, done) runs pan/zoom steps on the first
+# map one after another and records the time between animation frames while
+# each one animates and redraws. Needs READY_SCRIPT for window.__maps.
+INTERACTION_SCRIPT = """
+    <script>
+    window.__benchmarkInteractions = function (steps, done) {
+        var map = window.__maps[0];
+        var results = [];
+        function runStep(i) {
+            if (i >= steps.length) { done(results); return; }
+            var step = steps[i];
+            var frames = [];
+            var recording = true;
+            var last = performance.now();
+            var start = last;
+            function frame(now) {
+                frames.push(now - last);
+                last = now;
+                if (recording) { requestAnimationFrame(frame); }
+            }
+            requestAnimationFrame(frame);
+            map.once("moveend", function () {
+                // keep recording until the new view has been drawn
+                requestAnimationFrame(function () {
+                    requestAnimationFrame(function () {
+                        recording = false;
+                        results.push({action: step.action, duration_ms: performance.now() - start, frames_ms: frames});
+                        setTimeout(function () { runStep(i + 1); }, step.pause_ms || 250);
+                    });
+                });
+            });
+            if (step.action === "pan") {
+                map.panBy(step.offset, {animate: true, duration: 0.5});
+            } else if (step.action === "zoom_in") {
+                map.zoomIn(1, {animate: true});
+            } else {
+                map.zoomOut(1, {animate: true});
+            }
+        }
+        runStep(0);
+    };
+    window.__vectorElementCount = function () {
+        return {
+            svg_paths: document.querySelectorAll(".leaflet-overlay-pane path").length,
+            canvases: document.querySelectorAll(".leaflet-overlay-pane canvas").length
+        };
+    };
+    </script>
+"""
+
+DEFAULT_STEPS = [
+    {"action": "pan", "offset": [300, 0]},
+    {"action": "pan", "offset": [0, 300]},
+    {"action": "pan", "offset": [-300, 0]},
+    {"action": "pan", "offset": [0, -300]},
+    {"action": "zoom_out"},
+    {"action": "zoom_out"},
+    {"action": "pan", "offset": [200, 200]},
+    {"action": "zoom_in"},
+    {"action": "zoom_in"},
+]
+
+# frames slower than this are counted as dropped (20 fps)
+SLOW_FRAME_MS = 50
+
+
+def write_benchmark_html(html_path):
+    """Write a copy of a saved map with the ready signal and benchmark hooks and return its path"""
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    benchmark_html = html_content.replace('</head>', READY_SCRIPT + INTERACTION_SCRIPT + '</head>', 1)
+
+    benchmark_html_path = str(html_path).replace('.html', '_benchmark.html')
+    with open(benchmark_html_path, 'w', encoding='utf-8') as f:
+        f.write(benchmark_html)
+    return benchmark_html_path
+
+
+def _frame_summary(frames_ms):
+    frames_ms = np.asarray(frames_ms, dtype=float)
+    if len(frames_ms) == 0:
+        return {"frames": 0}
+    return {
+        "frames": int(len(frames_ms)),
+        "p50_ms": round(float(np.percentile(frames_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(frames_ms, 95)), 1),
+        "max_ms": round(float(frames_ms.max()), 1),
+        "slow_frames": int((frames_ms > SLOW_FRAME_MS).sum()),
+    }
+
+
+def benchmark_map(service, html_path, steps=DEFAULT_STEPS, runs=3):
+    """Load a saved map runs times in a warm browser and time its first render and pan/zoom frames.
+
+    Returns a dict with the per-run time to first render (navigation start
+    to every tile and layer painted, see READY_SCRIPT), the number of svg
+    paths/canvases drawn, and frame time percentiles for pans and zooms over
+    all runs.
+    """
+    benchmark_html_path = write_benchmark_html(html_path)
+    first_render_ms = []
+    frames = {"pan": [], "zoom": []}
+    durations = {"pan": [], "zoom": []}
+    elements = None
+
+    with service.driver() as driver:
+        for run in range(runs):
+            service.load(driver, benchmark_html_path)
+            first_render_ms.append(round(driver.execute_script("return window.__mapReadyAt;"), 1))
+            elements = driver.execute_script("return window.__vectorElementCount();")
+
+            results = driver.execute_async_script(
+                "window.__benchmarkInteractions(arguments[0], arguments[arguments.length - 1]);",
+                steps,
+            )
+            for result in results:
+                kind = "pan" if result["action"] == "pan" else "zoom"
+                frames[kind].extend(result["frames_ms"])
+                durations[kind].append(result["duration_ms"])
+
+    report = {
+        "html_path": str(html_path),
+        "runs": runs,
+        "first_render_ms": first_render_ms,
+        "first_render_median_ms": float(np.median(first_render_ms)),
+        "vector_elements": elements,
+    }
+    for kind in ("pan", "zoom"):
+        report[kind] = _frame_summary(frames[kind])
+        report[kind]["median_duration_ms"] = round(float(np.median(durations[kind])), 1) if durations[kind] else None
+    print(f"{html_path}: first render {report['first_render_median_ms']:.0f} ms, "
+          f"pan p95 {report['pan'].get('p95_ms')} ms, zoom p95 {report['zoom'].get('p95_ms')} ms")
+    return report
+
+
+def benchmark_maps(html_paths, runs=3, window_size=(1280, 800), steps=DEFAULT_STEPS, report_path=None, timeout=120):
+    """Benchmark several saved maps (e.g. the svg and canvas builds of one map) in headless Chrome.
+
+    Maps are measured one after another in the same browser so they are
+    comparable. Returns a list of per-map reports (see benchmark_map) and
+    writes them as json to report_path when given.
+    """
+    start = time.perf_counter()
+    reports = []
+    with ScreenshotService(window_size=window_size, timeout=timeout) as service:
+        for html_path in html_paths:
+            try:
+                reports.append(benchmark_map(service, html_path, steps=steps, runs=runs))
+            except Exception as e:
+                print(f"Error benchmarking {html_path}: {e}")
+                reports.append({"html_path": str(html_path), "error": f"{type(e).__name__}: {e}"})
+
+    print(f"benchmarked {len(reports)} maps in {time.perf_counter() - start:.1f}s")
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"window_size": list(window_size), "steps": steps, "maps": reports}, f, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    from ski_map import load_wa_layers, create_map
+
+    # build the statewide map once per renderer and compare them
+    layers, _ = load_wa_layers(max_workers=6)
+    html_paths = []
+    for renderer in ("svg", "canvas"):
+        m = create_map(dict(layers), simplify_tolerance=5, coordinate_decimals=5, conflate_tolerance=10, renderer=renderer)
+        html_path = f"data/wa_map_{renderer}.html"
+        m.save(html_path)
+        html_paths.append(html_path)
+
+    benchmark_maps(html_paths, runs=3, report_path="data/render_benchmark.json")
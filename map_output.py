@@ -0,0 +1,260 @@
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import shapely
+from branca.element import MacroElement
+from folium.utilities import JsCode
+from jinja2 import Template
+
+# paper sizes in inches (portrait), shared by the browser and static renderers
+PAGE_SIZES = {
+    "letter": (8.5, 11),
+    "legal": (8.5, 14),
+    "tabloid": (11, 17),
+}
+
+# Leaflet vector renderers. SVG keeps one DOM node per path and slows down past
+# a few thousand paths; canvas draws everything into one element.
+RENDERERS = {"svg": "L.svg()", "canvas": "L.canvas()"}
+
+
+def quantize_coordinates(gdf, decimals=6):
+    """Snap geometry coordinates to a 10**-decimals grid before they are written into a map.
+
+    6 decimal places is ~0.1 m in EPSG:4326, 5 is ~1 m. Snapping goes through
+    shapely.set_precision, which also drops the duplicate consecutive vertices
+    and collapsed parts the rounding creates; features that collapse entirely
+    are removed.
+    """
+    if gdf is None or gdf.empty or decimals is None:
+        return gdf
+
+    quantized = gdf.copy()
+    quantized["geometry"] = shapely.set_precision(gdf.geometry.values, 10 ** -decimals)
+    quantized = quantized[~quantized.geometry.is_empty]
+    return quantized
+
+
+def quantize_layers(layers, decimals=6):
+    """Quantize a dict of layer name -> GeoDataFrame and report the GeoJSON size saved per layer.
+
+    Returns the quantized layers (same keys) and a list of per-layer size
+    reports; layers that are None or empty are passed through unchanged.
+    """
+    quantized_layers = {}
+    report = []
+    for name, gdf in layers.items():
+        if gdf is None or gdf.empty or decimals is None:
+            quantized_layers[name] = gdf
+            continue
+
+        quantized = quantize_coordinates(gdf, decimals)
+        bytes_before = len(gdf.to_json())
+        bytes_after = len(quantized.to_json())
+        report.append({
+            "layer": name,
+            "decimals": decimals,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+        })
+        print(f"{name}: {bytes_before / 1e6:.2f} -> {bytes_after / 1e6:.2f} MB "
+              f"at {decimals} decimal places")
+        quantized_layers[name] = quantized
+    return quantized_layers, report
+
+
+def write_layer_data(gdf, name, out_dir):
+    """Write a layer as a content-hashed GeoJSON file plus gzip and brotli copies.
+
+    The file name carries a hash of its content ({name}.{hash}.geojson), so
+    browsers and CDNs can cache it forever and an unchanged layer keeps its
+    name across rebuilds. .gz/.br copies are written next to it for servers
+    that serve pre-compressed files; brotli is skipped if the package is not
+    installed. Returns the file name and the compressed sizes in bytes.
+    """
+    out_dir = Path(out_dir)
+    data = gdf.to_json().encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    file_name = f"{name}.{digest}.geojson"
+    file_path = out_dir / file_name
+
+    sizes = {"raw": len(data)}
+    gz_path = Path(f"{file_path}.gz")
+    br_path = Path(f"{file_path}.br")
+    if file_path.exists() and gz_path.exists() and br_path.exists():
+        # same content hash, already written by an earlier build
+        sizes["gzip"] = os.path.getsize(gz_path)
+        sizes["brotli"] = os.path.getsize(br_path)
+        return file_name, sizes
+
+    # write whatever is missing, e.g. the .br copy once brotli gets installed
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if not file_path.exists():
+        with open(file_path, "wb") as f:
+            f.write(data)
+    if gz_path.exists():
+        sizes["gzip"] = os.path.getsize(gz_path)
+    else:
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(gz_path, "wb") as f:
+            f.write(compressed)
+        sizes["gzip"] = len(compressed)
+    try:
+        import brotli
+        compressed = brotli.compress(data, quality=11)
+        with open(br_path, "wb") as f:
+            f.write(compressed)
+        sizes["brotli"] = len(compressed)
+    except ImportError:
+        print("brotli not installed, skipping .br output")
+
+    print(f"{name}: wrote {file_name} ({sizes['raw'] / 1e6:.2f} MB, {sizes['gzip'] / 1e6:.2f} MB gzipped)")
+    return file_name, sizes
+
+
+def renderer_options(renderer):
+    """folium.GeoJson keyword arguments drawing a layer with renderer ("svg", "canvas" or None for the map default)"""
+    if renderer is None:
+        return {}
+    return {"renderer": JsCode(RENDERERS[renderer])}
+
+
+class ExternalGeoJson(MacroElement):
+    """Fill the parent feature group from a GeoJSON file fetched after the page loads.
+
+    The file is only fetched the first time the group is shown on the map, so
+    the basemap paints immediately and hidden layers cost nothing. While the
+    fetch is running window.__mapPending is raised, which holds back the
+    screenshot ready signal (see map_screenshots.READY_SCRIPT). fetch() needs
+    the page to be served over http, not opened from file://. renderer
+    ("svg" or "canvas") overrides the map's default vector renderer.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var group = {{ this._parent.get_name() }};
+            var loaded = false;
+            function load() {
+                if (loaded) { return; }
+                loaded = true;
+                window.__mapPending = (window.__mapPending || 0) + 1;
+                fetch({{ this.url_json }})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        var style = {{ this.style_json }};
+                        {% if this.renderer %}style = L.extend({renderer: {{ this.renderer }}}, style);{% endif %}
+                        L.geoJSON(data, {
+                            {% if this.renderer %}renderer: style.renderer,{% endif %}
+                            style: function () { return style; },
+                            pointToLayer: function (feature, latlng) {
+                                return {{ this.point_factory }}(latlng, style);
+                            }
+                        }){% if this.tooltip %}.bindTooltip({{ this.tooltip_json }}){% endif %}.addTo(group);
+                    })
+                    .catch(function (error) { console.error("failed to load " + {{ this.url_json }}, error); })
+                    .finally(function () { window.__mapPending -= 1; });
+            }
+            group.on("add", load);
+            if (group._map) { load(); }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, style, tooltip=None, point_factory="L.circle", renderer=None):
+        super().__init__()
+        self._name = "ExternalGeoJson"
+        self.url_json = json.dumps(url)
+        self.style_json = json.dumps(style)
+        self.tooltip = tooltip
+        self.tooltip_json = json.dumps(tooltip)
+        self.point_factory = point_factory
+        self.renderer = RENDERERS[renderer] if renderer is not None else None
+
+
+class LodGeoJson(MacroElement):
+    """Fill the parent feature group with the version of a layer generalized for the current zoom.
+
+    levels is a list of (min_zoom, url) pairs, coarsest first; the level
+    with the highest min_zoom at or below the map zoom is drawn and the
+    others are removed, so only one version is active at a time. Each
+    version's file is fetched the first time it is needed, so the full
+    detail file is only downloaded once the map is zoomed in that far.
+    Fetches hold back the screenshot ready signal like ExternalGeoJson.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var group = {{ this._parent.get_name() }};
+            var levels = {{ this.levels_json }};
+            var style = {{ this.style_json }};
+            {% if this.renderer %}style = L.extend({renderer: {{ this.renderer }}}, style);{% endif %}
+            var loaded = {};
+            var active = null;
+            var attachedMap = null;
+
+            function levelFor(zoom) {
+                var level = levels[0];
+                levels.forEach(function (candidate) {
+                    if (candidate[0] <= zoom) { level = candidate; }
+                });
+                return level;
+            }
+
+            function show(level) {
+                if (active === level[0] || !group._map) { return; }
+                if (active !== null) { group.removeLayer(loaded[active]); }
+                group.addLayer(loaded[level[0]]);
+                active = level[0];
+            }
+
+            function update() {
+                if (!group._map) { return; }
+                var level = levelFor(group._map.getZoom());
+                if (loaded[level[0]] instanceof L.Layer) { show(level); return; }
+                if (loaded[level[0]] === "loading") { return; }
+                loaded[level[0]] = "loading";
+                window.__mapPending = (window.__mapPending || 0) + 1;
+                fetch(level[1])
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        loaded[level[0]] = L.geoJSON(data, {
+                            {% if this.renderer %}renderer: style.renderer,{% endif %}
+                            style: function () { return style; }
+                        }){% if this.tooltip %}.bindTooltip({{ this.tooltip_json }}){% endif %};
+                        // the map may have moved on while this level was loading
+                        if (group._map && levelFor(group._map.getZoom())[0] === level[0]) { show(level); }
+                    })
+                    .catch(function (error) {
+                        delete loaded[level[0]];
+                        console.error("failed to load " + level[1], error);
+                    })
+                    .finally(function () { window.__mapPending -= 1; });
+            }
+
+            function attach() {
+                attachedMap = group._map;
+                attachedMap.on("zoomend", update);
+                update();
+            }
+            group.on("add", attach);
+            group.on("remove", function () {
+                if (attachedMap) { attachedMap.off("zoomend", update); }
+            });
+            if (group._map) { attach(); }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels, style, tooltip=None, renderer=None):
+        super().__init__()
+        self._name = "LodGeoJson"
+        self.levels_json = json.dumps([[int(min_zoom), url] for min_zoom, url in levels])
+        self.style_json = json.dumps(style)
+        self.tooltip = tooltip
+        self.tooltip_json = json.dumps(tooltip)
+        self.renderer = RENDERERS[renderer] if renderer is not None else None
@@ -0,0 +1,339 @@
+import base64
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+
+from map_output import PAGE_SIZES
+
+# hides controls and disables interaction so the capture is a clean static map
+STATIC_CSS = """
+    <style>
+    .leaflet-container {
+        cursor: default !important;
+        pointer-events: none !important;
+    }
+    .leaflet-control-zoom,
+    .leaflet-control-attribution,
+    .leaflet-control-layers {
+        display: none !important;
+    }
+    </style>
+"""
+
+# sets window.__mapReady (and window.__mapReadyAt, ms since navigation) once
+# every Leaflet tile layer has finished loading and the result has been painted. Layers that load data asynchronously can hold the
+# signal back by incrementing window.__mapPending and decrementing it when done.
+# window.__fitMap(bounds) moves the map to [[south, west], [north, east]] and
+# re-arms the signal for the new view.
+READY_SCRIPT = """
+    <script>
+    window.__mapReady = false;
+    window.__mapPending = window.__mapPending || 0;
+    window.__maps = [];
+    function __mapLoading() {
+        var count = window.__mapPending;
+        window.__maps.forEach(function (map) {
+            map.eachLayer(function (layer) {
+                if (layer instanceof L.GridLayer && (layer.isLoading ? layer.isLoading() : layer._loading)) {
+                    count++;
+                }
+            });
+        });
+        return count;
+    }
+    function __checkMapReady() {
+        if (__mapLoading() === 0) {
+            // two frames so the last tiles and overlays are painted before capture
+            requestAnimationFrame(function () {
+                requestAnimationFrame(function () {
+                    window.__mapReadyAt = performance.now();
+                    window.__mapReady = true;
+                });
+            });
+        } else {
+            setTimeout(__checkMapReady, 50);
+        }
+    }
+    window.__fitMap = function (bounds) {
+        window.__mapReady = false;
+        window.__maps.forEach(function (map) { map.fitBounds(bounds, {animate: false}); });
+        // give the new view a frame to request its tiles before polling
+        requestAnimationFrame(__checkMapReady);
+    };
+    window.addEventListener('load', function () {
+        Object.keys(window).forEach(function (key) {
+            try {
+                if (window[key] instanceof L.Map) { window.__maps.push(window[key]); }
+            } catch (e) {}
+        });
+        __checkMapReady();
+    });
+    </script>
+"""
+
+
+def write_static_html(html_path):
+    """Write a non-interactive copy of a saved map next to it and return its path"""
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    static_html = html_content.replace('</head>', STATIC_CSS + READY_SCRIPT + '</head>', 1)
+
+    static_html_path = str(html_path).replace('.html', '_static.html')
+    with open(static_html_path, 'w', encoding='utf-8') as f:
+        f.write(static_html)
+    return static_html_path
+
+
+def _page_handler(directory):
+    """static file handler for one map directory; never cached, so rewritten copies are always reloaded"""
+
+    class PageHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-store")
+            super().end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return PageHandler
+
+
+class ScreenshotService:
+    """Keeps a small pool of warm headless Chrome instances for rendering maps to PNG/PDF.
+
+    Browsers are started lazily (up to pool_size) and reused across renders;
+    each render waits for the page's map-ready signal instead of a fixed sleep.
+    Pages are loaded over http from a local server for their directory, since
+    Chrome's fetch() refuses file:// urls and the external data and vector
+    tile maps load their layers with it.
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, pool_size=1, window_size=(729, 943), timeout=60):
+        self.pool_size = pool_size
+        self.window_size = window_size
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _new_driver(self):
+        chrome_options = Options()
+        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument(f'--window-size={self.window_size[0]},{self.window_size[1]}')
+        return webdriver.Chrome(options=chrome_options)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._drivers) < self.pool_size:
+                driver = self._new_driver()
+                self._drivers.append(driver)
+                return driver
+        return self._idle.get()
+
+    def _page_url(self, html_path):
+        """http url of a saved page, served with its data files from a local server for its directory"""
+        html_path = Path(html_path).resolve()
+        directory = str(html_path.parent)
+        with self._lock:
+            if directory not in self._servers:
+                server = ThreadingHTTPServer(("127.0.0.1", 0), _page_handler(directory))
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                self._servers[directory] = server
+            port = self._servers[directory].server_address[1]
+        return f"http://127.0.0.1:{port}/{quote(html_path.name)}"
+
+    def _release(self, driver):
+        self._idle.put(driver)
+
+    def _wait_until_ready(self, driver):
+        WebDriverWait(driver, self.timeout).until(
+            lambda d: d.execute_script("return window.__mapReady === true")
+        )
+
+    @contextmanager
+    def driver(self):
+        """Borrow a warm browser from the pool for custom scripting (e.g. map_benchmark).
+
+        It goes back to the pool when the block exits; open pages with load().
+        """
+        driver = self._acquire()
+        try:
+            driver.set_script_timeout(self.timeout)
+            yield driver
+        finally:
+            self._release(driver)
+
+    def load(self, driver, html_path, window_size=None):
+        """open a saved page carrying READY_SCRIPT in a borrowed browser and wait until the map is drawn"""
+        if window_size is not None:
+            driver.set_window_size(*window_size)
+        driver.get(self._page_url(html_path))
+        self._wait_until_ready(driver)
+
+    def render(self, html_path, output_path=None, pdf_path=None, window_size=None, landscape=False, pdf_options=None, bounds=None,
+               static_html_path=None):
+        """Render a saved map to PNG and/or PDF, returns a dict of timings in seconds
+
+        bounds ((west, south, east, north) in EPSG:4326) crops the map to a region
+        before capture. static_html_path is a copy already written by
+        write_static_html; renders running at the same time must share one
+        instead of each rewriting it while another browser loads it.
+        """
+        start = time.perf_counter()
+        static_html_path = static_html_path or write_static_html(html_path)
+        window_size = window_size or self.window_size
+
+        with self.driver() as driver:
+            self.load(driver, static_html_path, window_size)
+            if bounds is not None:
+                west, south, east, north = bounds
+                driver.execute_script("window.__fitMap(arguments[0]);", [[south, west], [north, east]])
+                self._wait_until_ready(driver)
+            ready = time.perf_counter()
+
+            if output_path:
+                driver.save_screenshot(str(output_path))
+
+            if pdf_path:
+                # Use Chrome DevTools Protocol (CDP) to print to PDF
+                options = {"printBackground": True, "landscape": landscape}
+                options.update(pdf_options or {})
+                pdf = driver.execute_cdp_cmd("Page.printToPDF", options)
+                with open(pdf_path, "wb") as f:
+                    f.write(base64.b64decode(pdf['data']))
+
+        end = time.perf_counter()
+        return {"load_s": ready - start, "capture_s": end - ready, "total_s": end - start}
+
+    def close(self):
+        with self._lock:
+            for driver in self._drivers:
+                driver.quit()
+            self._drivers = []
+            self._idle = queue.Queue()
+            for server in self._servers.values():
+                server.shutdown()
+                server.server_close()
+            self._servers = {}
+
+
+# css pixels per inch, used to size the browser window for a page
+SCREEN_DPI = 96
+
+
+def _job_page(job):
+    """window size in pixels and pdf paper options for a batch job"""
+    size = job.get("size", "letter")
+    landscape = job.get("orientation", "portrait") == "landscape"
+    if isinstance(size, str):
+        width_in, height_in = PAGE_SIZES[size]
+        if landscape:
+            width_in, height_in = height_in, width_in
+        window_size = (int(width_in * SCREEN_DPI), int(height_in * SCREEN_DPI))
+        # the window is already rotated, so print the page unrotated at that size
+        pdf_options = {"paperWidth": width_in, "paperHeight": height_in,
+                       "marginTop": 0, "marginBottom": 0, "marginLeft": 0, "marginRight": 0}
+    else:
+        window_size = tuple(size)
+        if landscape:
+            window_size = (max(window_size), min(window_size))
+        pdf_options = {"paperWidth": window_size[0] / SCREEN_DPI, "paperHeight": window_size[1] / SCREEN_DPI}
+    return window_size, pdf_options
+
+
+def render_batch(jobs, max_workers=4, manifest_path=None, timeout=60):
+    """Render many map exports concurrently across a pool of browsers.
+
+    Each job is a dict with html_path, size (a PAGE_SIZES name or a
+    (width, height) window size in pixels), orientation ("portrait" or
+    "landscape"), output_path and/or pdf_path, and optional bounds
+    ((west, south, east, north)) for a regional crop. Returns the manifest, a
+    list of jobs with their timings or error, and writes it as json to
+    manifest_path when given.
+    """
+    start = time.perf_counter()
+    # one static copy per map, written before any browser loads it
+    static_html_paths = {}
+    for job in jobs:
+        if str(job["html_path"]) not in static_html_paths:
+            try:
+                static_html_paths[str(job["html_path"])] = write_static_html(job["html_path"])
+            except OSError:
+                # reported per job when its render fails
+                static_html_paths[str(job["html_path"])] = None
+
+    def run(job):
+        window_size, pdf_options = _job_page(job)
+        entry = {
+            "html_path": str(job["html_path"]),
+            "size": job.get("size", "letter"),
+            "orientation": job.get("orientation", "portrait"),
+            "window_size": list(window_size),
+            "output_path": str(job["output_path"]) if job.get("output_path") else None,
+            "pdf_path": str(job["pdf_path"]) if job.get("pdf_path") else None,
+            "bounds": list(job["bounds"]) if job.get("bounds") is not None else None,
+        }
+        try:
+            entry["timings"] = service.render(
+                job["html_path"],
+                job.get("output_path"),
+                job.get("pdf_path"),
+                window_size=window_size,
+                pdf_options=pdf_options,
+                bounds=job.get("bounds"),
+                static_html_path=static_html_paths[str(job["html_path"])],
+            )
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+            print(f"Error rendering {job['html_path']}: {e}")
+        return entry
+
+    with ScreenshotService(pool_size=max_workers, timeout=timeout) as service:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            manifest = list(executor.map(run, jobs))
+
+    print(f"rendered {len(manifest)} exports in {time.perf_counter() - start:.1f}s")
+    if manifest_path:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"total_s": time.perf_counter() - start, "exports": manifest}, f, indent=2)
+    return manifest
+
+
+def save_map_screenshot(html_path, output_path, pdf_path, window_size=(729, 943), service=None):
+    """Save map as static PNG screenshot and PDF
+
+    Pass a ScreenshotService to reuse its browser across several maps;
+    otherwise a browser is started for this map only.
+    """
+    if service is not None:
+        return service.render(html_path, output_path, pdf_path, window_size=window_size)
+
+    with ScreenshotService(window_size=window_size) as service:
+        return service.render(html_path, output_path, pdf_path, window_size=window_size)
@@ -0,0 +1,168 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from vector_tiles import ORIGIN_SHIFT
+
+# leaflet tile size in pixels, used to turn a pixel radius into metres per zoom level
+TILE_SIZE = 256
+
+
+def build_cluster_hierarchy(gdf, min_zoom=6, max_zoom=12, radius=40):
+    """Precompute point clusters for every zoom level from max_zoom down to min_zoom.
+
+    Points are binned on a web mercator grid whose cells are radius pixels wide
+    at each zoom; each level is built from the clusters of the level above, so
+    a cluster always splits cleanly into the clusters it was made of when you
+    zoom in. Cluster positions are count-weighted centroids. Above max_zoom
+    the map shows the individual points. Returns a json-ready dict,
+    {"min_zoom", "max_zoom", "levels": {zoom: [[lon, lat, count], ...]}}.
+    """
+    start = time.perf_counter()
+    points = gdf.geometry.representative_point().to_crs("EPSG:3857")
+    clusters = pd.DataFrame({"x": points.x.values, "y": points.y.values, "count": 1})
+
+    levels = {}
+    for z in range(max_zoom, min_zoom - 1, -1):
+        cell = radius * 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** z)
+        clusters["wx"] = clusters["x"] * clusters["count"]
+        clusters["wy"] = clusters["y"] * clusters["count"]
+        grouped = clusters.groupby(
+            [np.floor(clusters["x"] / cell), np.floor(clusters["y"] / cell)]
+        )[["wx", "wy", "count"]].sum()
+        clusters = pd.DataFrame({
+            "x": (grouped["wx"] / grouped["count"]).values,
+            "y": (grouped["wy"] / grouped["count"]).values,
+            "count": grouped["count"].values,
+        })
+
+        lonlat = gpd.GeoSeries(gpd.points_from_xy(clusters["x"], clusters["y"]), crs="EPSG:3857").to_crs("EPSG:4326")
+        levels[str(z)] = [
+            [round(lon, 5), round(lat, 5), int(count)]
+            for lon, lat, count in zip(lonlat.x, lonlat.y, clusters["count"])
+        ]
+
+    print(f"clustered {len(gdf)} points into "
+          f"{', '.join(f'z{z}: {len(level)}' for z, level in sorted(levels.items(), key=lambda item: int(item[0])))} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return {"min_zoom": min_zoom, "max_zoom": max_zoom, "levels": levels}
+
+
+def cluster_file_name(data_file_name):
+    """cluster hierarchy file written next to a layer data file, {name}.{hash}.clusters.json"""
+    return f"{Path(data_file_name).stem}.clusters.json"
+
+
+def write_cluster_data(hierarchy, data_file_name, out_dir):
+    """write a cluster hierarchy next to its layer's data file, returns the file name"""
+    file_name = cluster_file_name(data_file_name)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(out_dir) / file_name, "w", encoding="utf-8") as f:
+        json.dump(hierarchy, f, separators=(",", ":"))
+    return file_name
+
+
+class ClusteredPoints(MacroElement):
+    """Show precomputed clusters in place of a point layer up to the hierarchy's max zoom.
+
+    detail is a hidden, control-less FeatureGroup inside the same parent
+    group that holds the individual points; it is only added to the map once
+    you zoom in past max_zoom, so an ExternalGeoJson inside it is not fetched
+    until then. Clusters are drawn as circle markers on a shared canvas,
+    sized by count; clicking one zooms in on it. Pass the hierarchy itself
+    (see build_cluster_hierarchy) or the url of its json file.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var group = {{ this._parent.get_name() }};
+            var detail = {{ this.detail.get_name() }};
+            var style = {{ this.style_json }};
+            var renderer = L.canvas();
+            var clusters = L.layerGroup();
+            var hierarchy = null;
+            var drawnZoom = null;
+
+            function clusterMarker(cluster) {
+                var count = cluster[2];
+                var marker = L.circleMarker([cluster[1], cluster[0]], L.extend({}, style, {
+                    renderer: renderer,
+                    radius: count === 1 ? 4 : Math.min(6 + 3 * Math.log2(count), 24)
+                }));
+                if (count > 1) {
+                    marker.bindTooltip(count + " " + {{ this.label_json }});
+                    marker.on("click", function (e) {
+                        group._map.setView(e.latlng, Math.min(group._map.getZoom() + 2, hierarchy.max_zoom + 1));
+                    });
+                }
+                return marker;
+            }
+
+            function sync() {
+                var map = group._map;
+                if (!map || !hierarchy) { return; }
+                var zoom = map.getZoom();
+                if (zoom > hierarchy.max_zoom) {
+                    group.removeLayer(clusters);
+                    drawnZoom = null;
+                    group.addLayer(detail);
+                    return;
+                }
+                group.removeLayer(detail);
+                var level = Math.max(Math.round(zoom), hierarchy.min_zoom);
+                if (level !== drawnZoom) {
+                    clusters.clearLayers();
+                    (hierarchy.levels[level] || []).forEach(function (cluster) {
+                        clusters.addLayer(clusterMarker(cluster));
+                    });
+                    drawnZoom = level;
+                }
+                group.addLayer(clusters);
+            }
+
+            function load() {
+                if (hierarchy) { sync(); return; }
+                {% if this.url_json %}
+                window.__mapPending = (window.__mapPending || 0) + 1;
+                fetch({{ this.url_json }})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) { hierarchy = data; sync(); })
+                    .catch(function (error) { console.error("failed to load " + {{ this.url_json }}, error); })
+                    .finally(function () { window.__mapPending -= 1; });
+                {% else %}
+                hierarchy = {{ this.hierarchy_json }};
+                sync();
+                {% endif %}
+            }
+
+            var attachedMap = null;
+            function attach() {
+                attachedMap = group._map;
+                attachedMap.on("zoomend", sync);
+                load();
+            }
+            group.on("add", attach);
+            group.on("remove", function () {
+                if (attachedMap) { attachedMap.off("zoomend", sync); }
+            });
+            if (group._map) { attach(); }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, detail, style, hierarchy=None, url=None, label="points"):
+        super().__init__()
+        self._name = "ClusteredPoints"
+        self.detail = detail
+        # cluster markers are sized in pixels, the point style's radius is in metres
+        self.style_json = json.dumps({k: v for k, v in style.items() if k != "radius"})
+        self.hierarchy_json = json.dumps(hierarchy, separators=(",", ":")) if hierarchy is not None else None
+        self.url_json = json.dumps(url) if url is not None else None
+        self.label_json = json.dumps(label)
@@ -0,0 +1,208 @@
+import gzip
+import json
+import re
+from pathlib import Path
+
+from branca.element import MacroElement
+from jinja2 import Template
+
+# the client splits search text the same way (see SearchControl)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """lower-case alphanumeric words of a name"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def build_search_index(gdf, fields):
+    """Build a compact prefix-searchable name index for one layer.
+
+    fields are candidate name columns, the first one present in gdf is used.
+    Features sharing a name (e.g. the segments of one trail) become a single
+    entry whose bounding box covers all of them. Returns a json-ready dict,
+    {"field", "features": [[name, west, south, east, north], ...],
+    "tokens": [sorted words], "postings": [[feature ids per word], ...]},
+    or None when the layer has none of the fields.
+    """
+    field = next((f for f in fields if f in gdf.columns), None)
+    if field is None or gdf.empty:
+        return None
+
+    bounds = gdf.geometry.bounds
+    bounds["name"] = gdf[field].astype("string").str.strip()
+    bounds = bounds[bounds["name"].notna() & (bounds["name"] != "")]
+    named = bounds.groupby("name", sort=True).agg(
+        minx=("minx", "min"), miny=("miny", "min"), maxx=("maxx", "max"), maxy=("maxy", "max")
+    )
+
+    features = []
+    postings = {}
+    for feature_id, (name, row) in enumerate(named.iterrows()):
+        features.append([name] + [round(float(v), 5) for v in (row["minx"], row["miny"], row["maxx"], row["maxy"])])
+        for token in set(tokenize(name)):
+            postings.setdefault(token, []).append(feature_id)
+
+    tokens = sorted(postings)
+    return {
+        "field": field,
+        "features": features,
+        "tokens": tokens,
+        "postings": [postings[token] for token in tokens],
+    }
+
+
+def search_file_name(data_file_name):
+    """search index file written next to a layer data file, {name}.{hash}.search.json"""
+    return f"{Path(data_file_name).stem}.search.json"
+
+
+def write_search_index(index, data_file_name, out_dir):
+    """write a layer's search index (plus a .gz copy) next to its data file, returns the file name"""
+    file_name = search_file_name(data_file_name)
+    file_path = Path(out_dir) / file_name
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    with open(file_path, "wb") as f:
+        f.write(data)
+    with open(f"{file_path}.gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    return file_name
+
+
+class SearchControl(MacroElement):
+    """Search box that jumps the map to trail, trailhead and park names.
+
+    sources is a list of {"layer": display name, "url": index file} or
+    {"layer": display name, "index": index dict} (see build_search_index).
+    Index files are only fetched the first time the search box gets focus.
+    Every word typed is matched as a prefix against the index words; picking
+    a result fits the map to that feature's bounding box.
+    """
+
+    _template = Template("""
+        {% macro header(this, kwargs) %}
+        <style>
+            .map-search { background: white; padding: 4px; border-radius: 4px; box-shadow: 0 1px 5px rgba(0,0,0,0.4); }
+            .map-search input { width: 220px; padding: 4px; font-size: 14px; border: 1px solid #ccc; border-radius: 3px; }
+            .map-search ul { list-style: none; margin: 4px 0 0 0; padding: 0; max-height: 260px; overflow-y: auto; }
+            .map-search li { padding: 4px; cursor: pointer; font-size: 13px; }
+            .map-search li:hover, .map-search li.active { background: #e8f4f8; }
+            .map-search li small { color: #777; }
+        </style>
+        {% endmacro %}
+
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var sources = {{ this.sources_json }};
+            var indexes = null;
+            var loading = null;
+
+            function load() {
+                if (loading) { return loading; }
+                loading = Promise.all(sources.map(function (source) {
+                    if (source.index) { return Promise.resolve(source); }
+                    return fetch(source.url)
+                        .then(function (response) { return response.json(); })
+                        .then(function (index) { return {layer: source.layer, index: index}; })
+                        .catch(function (error) { console.error("failed to load " + source.url, error); return null; });
+                })).then(function (loaded) {
+                    indexes = loaded.filter(function (source) { return source && source.index; });
+                });
+                return loading;
+            }
+
+            // feature ids of every index word starting with prefix
+            function prefixIds(index, prefix) {
+                var tokens = index.tokens, lo = 0, hi = tokens.length;
+                while (lo < hi) {
+                    var mid = (lo + hi) >> 1;
+                    if (tokens[mid] < prefix) { lo = mid + 1; } else { hi = mid; }
+                }
+                var ids = {};
+                for (var i = lo; i < tokens.length && tokens[i].lastIndexOf(prefix, 0) === 0; i++) {
+                    index.postings[i].forEach(function (id) { ids[id] = true; });
+                }
+                return ids;
+            }
+
+            function search(text, limit) {
+                var words = text.toLowerCase().match(/[a-z0-9]+/g);
+                if (!words || !indexes) { return []; }
+                var results = [];
+                indexes.forEach(function (source) {
+                    var ids = null;
+                    words.forEach(function (word) {
+                        var matches = prefixIds(source.index, word);
+                        if (ids === null) { ids = matches; return; }
+                        Object.keys(ids).forEach(function (id) { if (!matches[id]) { delete ids[id]; } });
+                    });
+                    Object.keys(ids).forEach(function (id) {
+                        var feature = source.index.features[id];
+                        results.push({name: feature[0], layer: source.layer, bounds: feature.slice(1)});
+                    });
+                });
+                var start = words.join(" ");
+                results.sort(function (a, b) {
+                    var aStart = a.name.toLowerCase().lastIndexOf(start, 0) === 0 ? 0 : 1;
+                    var bStart = b.name.toLowerCase().lastIndexOf(start, 0) === 0 ? 0 : 1;
+                    return aStart - bStart || a.name.length - b.name.length || (a.name < b.name ? -1 : 1);
+                });
+                return results.slice(0, limit);
+            }
+
+            function jump(result) {
+                var b = result.bounds;
+                map.fitBounds([[b[1], b[0]], [b[3], b[2]]], {maxZoom: {{ this.max_zoom }}, padding: [20, 20]});
+            }
+
+            var control = L.control({position: {{ this.position_json }}});
+            control.onAdd = function () {
+                var div = L.DomUtil.create("div", "map-search");
+                var input = L.DomUtil.create("input", "", div);
+                var list = L.DomUtil.create("ul", "", div);
+                var results = [];
+                input.type = "search";
+                input.placeholder = {{ this.placeholder_json }};
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+
+                function render() {
+                    list.innerHTML = "";
+                    results.forEach(function (result, i) {
+                        var item = L.DomUtil.create("li", i === 0 ? "active" : "", list);
+                        item.textContent = result.name + " ";
+                        var layer = L.DomUtil.create("small", "", item);
+                        layer.textContent = result.layer;
+                        item.addEventListener("click", function () { jump(result); });
+                    });
+                }
+                function update() {
+                    load().then(function () {
+                        results = search(input.value, {{ this.max_results }});
+                        render();
+                    });
+                }
+                input.addEventListener("focus", load);
+                input.addEventListener("input", update);
+                input.addEventListener("keydown", function (e) {
+                    if (e.key === "Enter" && results.length) { jump(results[0]); }
+                    if (e.key === "Escape") { input.value = ""; results = []; render(); }
+                });
+                return div;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, sources, position="topright", placeholder="Search trails, trailheads, parks",
+                 max_results=10, max_zoom=15):
+        super().__init__()
+        self._name = "SearchControl"
+        self.sources_json = json.dumps(sources, separators=(",", ":"))
+        self.position_json = json.dumps(position)
+        self.placeholder_json = json.dumps(placeholder)
+        self.max_results = int(max_results)
+        self.max_zoom = int(max_zoom)
@@ -1,15 +1,27 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
+from shapely.geometry import Point, box
 import json
 import os
+import hashlib
 import folium
 from pathlib import Path
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import time
-import base64
-from folium.plugins import LocateControl
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from folium.plugins import LocateControl, VectorGridProtobuf
+from folium.utilities import JsCode
+from vector_tiles import build_vector_tiles
+from map_output import quantize_coordinates, quantize_layers, write_layer_data, renderer_options, ExternalGeoJson, LodGeoJson
+from map_screenshots import save_map_screenshot
+from static_render import render_static_map
+from point_clusters import build_cluster_hierarchy, cluster_file_name, write_cluster_data, ClusteredPoints
+from search_index import build_search_index, search_file_name, write_search_index, SearchControl
+from trail_conflation import conflate_trails
+from build_stats import start_run, stage, record, write_report
+from stream_reader import stream_to_parquet
+from tile_cache import export_tile_directory, local_tile_urls, start_tile_server
 
 
 def site_import(file_path, parameter=None):
@@ -59,54 +71,279 @@ def site_import(file_path, parameter=None):
     return sites_gdf
 
 
-def wa_trailheads_import():
-    """import washington trails"""
-    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/WATrailheads_All.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
+GIS_DATA_DIR = "C:/Users/IHiggins/OneDrive - King County/gis_data"
+LAYER_CACHE_DIR = "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/layer_cache"
+TILE_CACHE_DIR = "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/tile_cache"
 
-    for col in full_gdf.columns:
-        if full_gdf[col].dtype == 'datetime64[ns]' or str(full_gdf[col].dtype).startswith('datetime'):
-            full_gdf[col] = full_gdf[col].astype(str)
-    return full_gdf
 
-def wa_federal_trails_import():
-    """import washington trails"""
-    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/WATrails2017_Federal.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
-    return full_gdf
+def _file_hash(file_path, chunk_size=1 << 20):
+    """sha256 of a file, read in chunks so large geojson never sits in memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def wa_other_trails_import():
-    """import washington trails"""
-    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/WATrails2017_Other.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
-    return full_gdf
 
-def wa_state_trails_import():
-    """import washington trails"""
+def _read_source_layer(source_path, clean_datetimes=False, columns=None, bbox=None, mask=None, crs="EPSG:4326"):
+    """parse a source geojson, reproject to crs and optionally stringify datetimes
+
+    columns, bbox and mask are pushed down into the reader so unneeded
+    attributes and out-of-region features are never materialized. bbox
+    (minx, miny, maxx, maxy) and mask are in EPSG:4326.
+    """
     os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/WATrails2017_State.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
+    # wrapping the region in a GeoSeries lets geopandas reproject it to the source crs
+    if bbox is not None:
+        bbox = gpd.GeoSeries([box(*bbox)], crs="EPSG:4326")
+    if mask is not None:
+        mask = gpd.GeoSeries([mask], crs="EPSG:4326")
+    with stage(f"read {Path(source_path).name}") as read_stage:
+        full_gdf = read_stage.count(gpd.read_file(
+            source_path,
+            columns=list(columns) if columns is not None else None,
+            bbox=bbox,
+            mask=mask,
+        ))
+    with stage(f"reproject {Path(source_path).name}"):
+        full_gdf = full_gdf.to_crs(crs)
+
+    if clean_datetimes:
+        for col in full_gdf.columns:
+            if full_gdf[col].dtype == 'datetime64[ns]' or str(full_gdf[col].dtype).startswith('datetime'):
+                full_gdf[col] = full_gdf[col].astype(str)
     return full_gdf
 
 
+def read_cached_layer(source_path, clean_datetimes=False, columns=None, bbox=None, mask=None, crs="EPSG:4326", cache_dir=LAYER_CACHE_DIR, stream=False):
+    """Load a source layer from the GeoParquet cache, re-parsing the geojson only when it changed.
 
-def wa_winter_trails_import():
-    """import washington trails"""
-    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/Winter_Rec_Non_Motorized_Trails_-5873392780439031327.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
-    return full_gdf
+    The cache key is the source path, size, mtime and sha256. When path, size
+    and mtime still match the cache is used as is; otherwise the file is hashed
+    and, if only the mtime moved (e.g. a OneDrive re-sync), the cached layer is
+    kept and its key refreshed. Each combination of columns/bbox/mask is cached
+    separately. stream=True fills the cache in bounded batches (see
+    stream_reader.stream_to_parquet) instead of parsing the whole source at
+    once, for statewide files whose parse peaks far above the final layer.
+    """
+    source_path = str(Path(source_path).resolve())
+    stat = os.stat(source_path)
+    key = {"path": source_path, "size": stat.st_size, "mtime": stat.st_mtime}
+    read_options = {
+        "clean_datetimes": clean_datetimes,
+        "columns": sorted(columns) if columns is not None else None,
+        "bbox": [float(v) for v in bbox] if bbox is not None else None,
+        "mask": hashlib.sha256(mask.wkb).hexdigest() if mask is not None else None,
+        "crs": crs,
+    }
 
-def wa_state_parks_import():
-    """import washington trails"""
-    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-    full_gdf = gpd.read_file("C:/Users/IHiggins/OneDrive - King County/gis_data/WA_state_parks.geojson")
-    full_gdf = full_gdf.to_crs("EPSG:4326")
+    cache_dir = Path(cache_dir)
+    variant = hashlib.sha256(json.dumps([source_path, read_options]).encode()).hexdigest()[:8]
+    cache_name = f"{Path(source_path).stem}_{variant}"
+    parquet_path = cache_dir / f"{cache_name}.parquet"
+    meta_path = cache_dir / f"{cache_name}.json"
+
+    cached_key = None
+    if parquet_path.exists() and meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            cached_key = json.load(f)
+
+    if cached_key is not None and cached_key.get("read_options") == read_options:
+        if all(cached_key.get(k) == v for k, v in key.items()):
+            print(f"Loading cached {Path(source_path).name}")
+            return gpd.read_parquet(parquet_path)
+
+        key["sha256"] = _file_hash(source_path)
+        if cached_key.get("sha256") == key["sha256"]:
+            print(f"Loading cached {Path(source_path).name} (unchanged content)")
+            cached_key.update(key)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(cached_key, f, indent=2)
+            return gpd.read_parquet(parquet_path)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if stream:
+        print(f"Streaming {Path(source_path).name}")
+        with stage(f"stream {Path(source_path).name}") as stream_stage:
+            stream_stage.info["rows"] = stream_to_parquet(
+                source_path, parquet_path, columns=columns, bbox=bbox, mask=mask, crs=crs, clean_datetimes=clean_datetimes,
+            )
+        full_gdf = gpd.read_parquet(parquet_path)
+    else:
+        print(f"Parsing {Path(source_path).name}")
+        full_gdf = _read_source_layer(source_path, clean_datetimes=clean_datetimes, columns=columns, bbox=bbox, mask=mask, crs=crs)
+        with stage(f"cache {Path(source_path).name}"):
+            full_gdf.to_parquet(parquet_path)
+
+    if "sha256" not in key:
+        key["sha256"] = _file_hash(source_path)
+    key["read_options"] = read_options
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(key, f, indent=2)
     return full_gdf
 
+
+# Declarative registry of the statewide layers, in draw order. Each entry holds
+# where the layer is read from (source, columns, crs) and how it is drawn (style,
+# tooltip, default visibility); loading and create_map are both driven from it.
+# The map only draws geometry with a static tooltip, so no attribute columns are
+# read by default (columns=None reads everything). "search" lists candidate name
+# columns for the search index; they are read on top of columns and the first
+# one the source actually has is indexed. "conflate" ranks the overlapping trail
+# layers: where they draw the same trail, the lowest number keeps it. An optional
+# "renderer" ("svg" or "canvas") overrides create_map's renderer for one layer.
+# "stream": True reads the source in bounded batches when the cache is filled.
+WA_LAYERS = {
+    "wa_trailheads": {
+        "name": "WA Trailheads",
+        "source": f"{GIS_DATA_DIR}/WATrailheads_All.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "clean_datetimes": True,
+        "geometry": "point",
+        # radius in meters (for actual geographic size)
+        "style": {"radius": 50, "fill": True, "fillColor": "#20B2AA", "fillOpacity": 0.7, "color": "black", "weight": 1},
+        "tooltip": "WA Trailheads",
+        "show": True,
+        "simplify": False,
+        "search": ["TH_NM", "TRAILHEAD", "NAME"],
+        # precomputed clusters up to zoom 12 (cells of radius pixels), single trailheads past that
+        "cluster": {"min_zoom": 6, "max_zoom": 12, "radius": 40},
+    },
+    "wa_federal_trails": {
+        "name": "WA Federal Trails",
+        "source": f"{GIS_DATA_DIR}/WATrails2017_Federal.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "geometry": "line",
+        "style": {"fillColor": "transparent", "color": "green", "weight": 2, "fillOpacity": 0},
+        "tooltip": "WA Federal Trails",
+        "show": True,
+        "simplify": True,
+        # largest source, read into the cache in batches
+        "stream": True,
+        "search": ["TR_NM", "TRAIL_NAME", "NAME"],
+        "conflate": 1,
+    },
+    "wa_other_trails": {
+        "name": "WA Other Trails",
+        "source": f"{GIS_DATA_DIR}/WATrails2017_Other.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "geometry": "line",
+        "style": {"fillColor": "transparent", "color": "#83D683", "weight": 2, "fillOpacity": 0},
+        "tooltip": "WA Other Trails",
+        "show": True,
+        "simplify": True,
+        "search": ["TR_NM", "TRAIL_NAME", "NAME"],
+        "conflate": 3,
+    },
+    "wa_state_trails": {
+        "name": "WA State Trails",
+        "source": f"{GIS_DATA_DIR}/WATrails2017_State.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "geometry": "line",
+        "style": {"fillColor": "transparent", "color": "#6AD44E", "weight": 2, "fillOpacity": 0},
+        "tooltip": "WA State Trails",
+        "show": True,
+        "simplify": True,
+        "search": ["TR_NM", "TRAIL_NAME", "NAME"],
+        "conflate": 2,
+    },
+    "wa_state_parks": {
+        "name": "WA State Parks",
+        "source": f"{GIS_DATA_DIR}/WA_state_parks.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "geometry": "polygon",
+        # yellow-green, pretty transparent
+        "style": {"fillColor": "#9ACD32", "color": "#9ACD32", "weight": 2, "fillOpacity": 0.3},
+        "tooltip": "WA State Parks",
+        "show": False,
+        "simplify": True,
+        "search": ["ParkName", "PARK_NAME", "NAME"],
+    },
+    "wa_winter_trails": {
+        "name": "Washington State Winter Non-Motorized Trails",
+        "source": f"{GIS_DATA_DIR}/Winter_Rec_Non_Motorized_Trails_-5873392780439031327.geojson",
+        "columns": [],
+        "crs": "EPSG:4326",
+        "geometry": "line",
+        "style": {"fillColor": "transparent", "color": "#AF6D23", "weight": 2, "dashArray": "10, 5", "fillOpacity": 0},
+        "tooltip": "Washington State Winter Non-Motorized Trails",
+        "show": True,
+        "simplify": True,
+        "search": ["TR_NM", "TrailName", "TRAIL_NAME", "NAME"],
+        "conflate": 4,
+    },
+}
+
+
+def import_layer(key, bbox=None, mask=None):
+    """import one registry layer through the GeoParquet cache"""
+    config = WA_LAYERS[key]
+    columns = config.get("columns")
+    if columns is not None and config.get("search"):
+        columns = list(columns) + [field for field in config["search"] if field not in columns]
+    return read_cached_layer(
+        config["source"],
+        clean_datetimes=config.get("clean_datetimes", False),
+        columns=columns,
+        bbox=bbox,
+        mask=mask,
+        crs=config.get("crs", "EPSG:4326"),
+        stream=config.get("stream", False),
+    )
+
+
+def _timed_layer_import(key, bbox=None, mask=None):
+    """run one layer import and return it with its wall time in seconds"""
+    start = time.perf_counter()
+    gdf = import_layer(key, bbox=bbox, mask=mask)
+    return gdf, time.perf_counter() - start
+
+
+def load_wa_layers(keys=None, max_workers=None, bbox=None, mask=None):
+    """Read and reproject registry layers in a process pool.
+
+    keys selects the layers a map variant uses (default: every layer in
+    WA_LAYERS); layers that aren't selected are never read from disk.
+    Returns a dict of layer key -> GeoDataFrame in registry order and a dict
+    of per-layer load times in seconds. max_workers=1 loads the layers one
+    after another in this process. bbox/mask (EPSG:4326) limit every layer to
+    a region of interest.
+    """
+    keys = [key for key in WA_LAYERS if keys is None or key in keys]
+    layers = {}
+    timings = {}
+    start = time.perf_counter()
+
+    if max_workers == 1:
+        for key in keys:
+            with stage(f"import {key}") as import_stage:
+                layers[key], timings[key] = _timed_layer_import(key, bbox, mask)
+                import_stage.count(layers[key])
+            print(f"loaded {key} in {timings[key]:.1f}s")
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_timed_layer_import, key, bbox, mask): key
+                for key in keys
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                layers[key], timings[key] = future.result()
+                # timed in the worker; the worker's memory isn't visible here
+                record(f"import {key}", layers[key], wall_s=round(timings[key], 3))
+                print(f"loaded {key} in {timings[key]:.1f}s")
+
+    print(f"loaded {len(layers)} layers in {time.perf_counter() - start:.1f}s")
+    # keep registry (draw) order
+    layers = {key: layers[key] for key in keys}
+    return layers, timings
+
+
 def basin_import():
     """Import or download watershed basins from King County GIS"""
     cache_path = "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/watersheds.geojson"
@@ -130,6 +367,116 @@ def basin_import():
         return None
 
 
+# projected CRS in metres used for simplification (UTM zone 10N covers western WA,
+# distortion across the rest of the state is well under 1%)
+METRIC_CRS = "EPSG:32610"
+
+
+def _simplify_lines(geoms, tolerance_m):
+    """Douglas-Peucker on line geometries, keeping every vertex that line parts share.
+
+    Each part is cut at the vertices where it meets another part, the pieces
+    are simplified on their own (Douglas-Peucker never moves end points) and
+    joined back together, so trails that met at a vertex still do.
+    """
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    include_z = bool(shapely.has_z(parts).any())
+    coords, coord_part = shapely.get_coordinates(parts, include_z=include_z, return_index=True)
+
+    # junctions: xy positions used more than once (a loop touching itself just keeps an extra vertex);
+    # hashed as complex numbers, much faster than sorting coordinate rows
+    is_junction = pd.Series(coords[:, 0] + 1j * coords[:, 1]).duplicated(keep=False).to_numpy()
+
+    # cut at interior junctions: the vertex ends one piece and (as a copy) starts the next
+    is_first = np.r_[True, coord_part[1:] != coord_part[:-1]]
+    is_last = np.r_[coord_part[1:] != coord_part[:-1], True]
+    is_cut = is_junction & ~is_first & ~is_last
+    repeats = 1 + is_cut
+    starts_piece = np.repeat(is_first, repeats)
+    starts_piece[np.cumsum(repeats)[is_cut] - 1] = True
+    piece_ids = np.cumsum(starts_piece) - 1
+    piece_part = np.repeat(coord_part, repeats)[starts_piece]
+    pieces = shapely.linestrings(np.repeat(coords, repeats, axis=0), indices=piece_ids)
+    pieces = shapely.simplify(pieces, tolerance_m, preserve_topology=True)
+
+    # join the pieces back up, dropping the duplicated first vertex of every piece after a part's first
+    coords, coord_piece = shapely.get_coordinates(pieces, include_z=include_z, return_index=True)
+    piece_starts_part = np.r_[True, piece_part[1:] != piece_part[:-1]]
+    starts_piece = np.r_[True, coord_piece[1:] != coord_piece[:-1]]
+    keep = ~(starts_piece & ~piece_starts_part[coord_piece])
+    parts = shapely.linestrings(coords[keep], indices=piece_part[coord_piece[keep]])
+
+    # single lines stay LineStrings
+    simplified = shapely.multilinestrings(parts, indices=part_feature)
+    first_part = np.searchsorted(part_feature, np.arange(len(geoms)))
+    is_single = shapely.get_type_id(geoms) == shapely.GeometryType.LINESTRING
+    simplified[is_single] = parts[first_part[is_single]]
+    return simplified
+
+
+def _simplify_geometries(geoms, tolerance_m):
+    """Simplify an array of projected geometries without pulling apart the places they meet.
+
+    Polygons that tile without overlaps (a valid coverage) are simplified
+    together with shapely.coverage_simplify, so neighbouring polygons keep
+    one shared boundary. Lines keep every vertex they share with another
+    line (see _simplify_lines); one that ends part way along another's
+    segment, away from its vertices, can still drift up to tolerance_m from
+    it. Anything else, including overlapping polygons, gets per-feature
+    Douglas-Peucker with preserve_topology=True, which only keeps each
+    geometry valid on its own, so shared edges may open small gaps.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    simplified = geoms.copy()
+    present = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    type_ids = set(shapely.get_type_id(geoms[present]))
+    polygon_ids = {shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON}
+    line_ids = {shapely.GeometryType.LINESTRING, shapely.GeometryType.MULTILINESTRING}
+    if not type_ids:
+        return simplified
+    if type_ids <= polygon_ids and shapely.coverage_is_valid(geoms[present]):
+        simplified[present] = shapely.coverage_simplify(geoms[present], tolerance_m)
+    elif type_ids <= line_ids:
+        simplified[present] = _simplify_lines(geoms[present], tolerance_m)
+    else:
+        simplified[present] = shapely.simplify(geoms[present], tolerance_m, preserve_topology=True)
+    return simplified
+
+
+def simplify_layer(gdf, tolerance_m, name="layer"):
+    """Simplify a layer with a tolerance in projected metres before it is embedded.
+
+    Uses _simplify_geometries, so polygons that share edges and lines that
+    meet at a vertex stay joined, and every geometry stays valid. Returns the
+    simplified layer in the original CRS and a dict of vertex/byte counts
+    before and after.
+    """
+    if gdf is None or gdf.empty or not tolerance_m:
+        return gdf, None
+
+    before_vertices = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    before_bytes = len(gdf.to_json())
+
+    simplified = gdf.copy()
+    metric = gdf.geometry.to_crs(METRIC_CRS)
+    simplified["geometry"] = gpd.GeoSeries(
+        _simplify_geometries(metric.values, tolerance_m), index=gdf.index, crs=METRIC_CRS
+    ).to_crs(gdf.crs)
+    simplified = simplified[~simplified.geometry.is_empty]
+
+    stats = {
+        "layer": name,
+        "tolerance_m": tolerance_m,
+        "vertices_before": before_vertices,
+        "vertices_after": int(shapely.get_num_coordinates(simplified.geometry.values).sum()),
+        "bytes_before": before_bytes,
+        "bytes_after": len(simplified.to_json()),
+    }
+    print(f"{name}: {stats['vertices_before']} -> {stats['vertices_after']} vertices, "
+          f"{stats['bytes_before'] / 1e6:.2f} -> {stats['bytes_after'] / 1e6:.2f} MB")
+    return simplified, stats
+
+
 def add_map_legend(m, layer_name='WTD Sites', show=True):
     """Add legend to map"""
     legend_html = f'''
@@ -187,15 +534,200 @@ def add_map_legend(m, layer_name='WTD Sites', show=True):
     return m
 
 
-def create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trails, wa_winter_trails, wa_state_parks):
-    """Create Folium map with sites and WTD service area"""
-    
+def add_vector_tile_layers(m, tile_url, keys, max_native_zoom=14):
+    """Add one VectorGrid layer per tiled layer; tiles are only fetched for the current viewport"""
+    for key in keys:
+        config = WA_LAYERS[key]
+        style = dict(config["style"])
+        if config["geometry"] == "point":
+            # VectorGrid draws points as circle markers, radius in pixels
+            style["radius"] = 4
+        VectorGridProtobuf(
+            tile_url.replace("{layer}", key),
+            config["name"],
+            {
+                # raw js so folium doesn't camel-case the layer name (wa_trailheads -> waTrailheads)
+                # and VectorGrid finds the style for the MVT layer of that name
+                "vectorTileLayerStyles": JsCode(json.dumps({key: style})),
+                "maxNativeZoom": max_native_zoom,
+                "rendererFactory": JsCode("L.canvas.tile"),
+            },
+            show=config["show"],
+        ).add_to(m)
+    return m
+
+
+def _point_detail_group(layer, key, hierarchy=None, url=None):
+    """for clustered layers, the hidden group the individual points go in; otherwise the layer itself"""
+    config = WA_LAYERS[key]
+    if not config.get("cluster"):
+        return layer
+    detail = folium.FeatureGroup(name=f"{config['name']} points", control=False, show=False)
+    detail.add_to(layer)
+    ClusteredPoints(detail, config["style"], hierarchy=hierarchy, url=url, label=config["tooltip"]).add_to(layer)
+    return detail
+
+
+def add_registry_layer(m, key, gdf):
+    """draw one registry layer as inline GeoJSON in its own feature group"""
+    config = WA_LAYERS[key]
+    layer = folium.FeatureGroup(name=config["name"], show=config["show"])
+    if config["geometry"] == "point":
+        hierarchy = None
+        if config.get("cluster"):
+            hierarchy = build_cluster_hierarchy(gdf, **config["cluster"])
+        folium.GeoJson(
+            gdf,
+            marker=folium.Circle(**config["style"]),
+            tooltip=config["tooltip"],
+            **renderer_options(config.get("renderer")),
+        ).add_to(_point_detail_group(layer, key, hierarchy=hierarchy))
+    else:
+        folium.GeoJson(
+            gdf,
+            style_function=lambda x, style=config["style"]: style,
+            tooltip=config["tooltip"],
+            **renderer_options(config.get("renderer")),
+        ).add_to(layer)
+    layer.add_to(m)
+    return m
+
+
+def _detail_file(file_name):
+    """full detail data file of a layer_files entry (a file name, or [min_zoom, file name] levels)"""
+    if isinstance(file_name, list):
+        return file_name[-1][1]
+    return file_name
+
+
+def add_external_registry_layer(m, key, file_name, layer_data_url):
+    """have the page fetch one registry layer's data file (or zoom levels, see LodGeoJson) asynchronously"""
+    config = WA_LAYERS[key]
+    layer = folium.FeatureGroup(name=config["name"], show=config["show"])
+    if isinstance(file_name, list):
+        LodGeoJson(
+            [(min_zoom, f"{layer_data_url}/{level_file}") for min_zoom, level_file in file_name],
+            config["style"],
+            tooltip=config["tooltip"],
+            renderer=config.get("renderer"),
+        ).add_to(layer)
+        layer.add_to(m)
+        return m
+    ExternalGeoJson(
+        f"{layer_data_url}/{file_name}",
+        config["style"],
+        tooltip=config["tooltip"],
+        renderer=config.get("renderer"),
+    ).add_to(_point_detail_group(layer, key, url=f"{layer_data_url}/{cluster_file_name(file_name)}"))
+    layer.add_to(m)
+    return m
+
+
+def add_search_control(m, layers, layer_files=None, layer_data_url=None):
+    """Add a search box over the name fields of the searchable registry layers.
+
+    With layer_files (key -> data file name) the page lazily fetches each
+    layer's search index file written next to its data file; otherwise the
+    indexes are built from layers and embedded in the page.
+    """
+    sources = []
+    for key, config in WA_LAYERS.items():
+        if not config.get("search"):
+            continue
+        if layer_files is not None and key in layer_files:
+            sources.append({"layer": config["name"], "url": f"{layer_data_url}/{search_file_name(_detail_file(layer_files[key]))}"})
+        elif key in layers:
+            index = build_search_index(layers[key], config["search"])
+            if index is not None:
+                sources.append({"layer": config["name"], "index": index})
+    if sources:
+        SearchControl(sources).add_to(m)
+    return m
+
+
+def create_map(layers, simplify_tolerance=None, vector_tile_url=None, coordinate_decimals=None, layer_data_dir=None, layer_data_url=None, layer_files=None, bounds=None, local_tiles=None, local_tiles_max_zoom=None, conflate_tolerance=None, renderer="svg", lod_levels=None):
+    """Create Folium map with the registry layers in layers (key -> GeoDataFrame)
+
+    simplify_tolerance (metres) simplifies the trail and park layers before
+    they are embedded; the per-layer size report is stored on m.simplify_stats.
+    vector_tile_url (e.g. "wa_tiles/{layer}/{z}/{x}/{y}.pbf", relative to the
+    saved html) draws the layers from tiles written by
+    vector_tiles.build_vector_tiles instead of inlining their GeoJSON.
+    coordinate_decimals rounds embedded coordinates (see
+    map_output.quantize_layers); its size report is stored on m.quantize_stats.
+    layer_data_dir writes each layer to a content-hashed, pre-compressed
+    GeoJSON file there instead of inlining it; the page fetches the files
+    from layer_data_url (relative to the saved html) after the basemap paints.
+    The written file names are stored on m.layer_files.
+    layer_files (key -> file name in layer_data_url) adds layers that were
+    already written by an earlier build without loading them; bounds
+    (minx, miny, maxx, maxy) then centers the map when no data is loaded.
+    local_tiles (basemap name -> url template, see tile_cache.local_tile_urls)
+    points basemaps at a local tile cache: exported tile directories for
+    offline use, or the localhost tile server for screenshot-only html, as
+    only this machine can reach it; local_tiles_max_zoom is the deepest cached zoom level.
+    conflate_tolerance (metres) drops the parts of trail segments that a
+    higher priority trail layer already draws and merges each trail layer's connected
+    segments (see trail_conflation.conflate_trails); the report is stored on
+    m.conflate_stats.
+    renderer ("svg" or "canvas") is the default Leaflet renderer for trails
+    and parks; a registry "renderer" entry overrides it per layer. Compare
+    the two with map_benchmark.benchmark_maps.
+    lod_levels, e.g. [(0, 200), (9, 50), (12, None)], writes one version of
+    every simplified layer per (min_zoom, tolerance in metres) into
+    layer_data_dir and the page draws the version for the current zoom,
+    fetching each the first time it is needed; None is the full detail
+    (simplify_tolerance) version. Their layer_files entries are
+    [min_zoom, file name] lists. Only used with layer_data_dir.
+    """
+    # only draw layers that were loaded, in registry order
+    layers = {
+        key: layers[key] for key in WA_LAYERS
+        if layers.get(key) is not None and not layers[key].empty
+    }
+
+    conflate_stats = []
+    trail_keys = sorted((key for key in layers if WA_LAYERS[key].get("conflate")), key=lambda key: WA_LAYERS[key]["conflate"])
+    if conflate_tolerance and trail_keys:
+        with stage("conflate trails") as conflate_stage:
+            conflated, conflate_stats = conflate_trails(
+                {key: layers[key] for key in trail_keys},
+                name_fields={key: WA_LAYERS[key].get("search", []) for key in trail_keys},
+                tolerance_m=conflate_tolerance,
+                metric_crs=METRIC_CRS,
+            )
+            layers.update(conflated)
+            conflate_stage.info["features_after"] = sum(len(conflated[key]) for key in trail_keys)
+
+    # generalized zoom levels start from the unsimplified layers
+    lod_sources = dict(layers)
+
+    simplify_stats = []
+    if simplify_tolerance:
+        for key, gdf in layers.items():
+            if WA_LAYERS[key]["simplify"]:
+                with stage(f"simplify {key}") as simplify_stage:
+                    layers[key], stats = simplify_layer(gdf, simplify_tolerance, WA_LAYERS[key]["name"])
+                    simplify_stage.count(layers[key])
+                if stats is not None:
+                    simplify_stats.append(stats)
+
+    quantize_stats = []
+    if coordinate_decimals is not None:
+        with stage("quantize"):
+            layers, quantize_stats = quantize_layers(layers, coordinate_decimals)
+
     # Center map on sites
     """bounds = sites_gdf.total_bounds
     center_lat = (bounds[1] + bounds[3]) / 2
     center_lon = (bounds[0] + bounds[2]) / 2"""
-    # set bounds to WTD service area
-    bounds = wa_trailheads.total_bounds
+    # center on the trailheads, or everything loaded if they are switched off
+    if bounds is not None:
+        pass
+    elif "wa_trailheads" in layers:
+        bounds = layers["wa_trailheads"].total_bounds
+    else:
+        bounds = gpd.GeoSeries([box(*gdf.total_bounds) for gdf in layers.values()]).total_bounds
     center_lat = (bounds[1] + bounds[3]) / 2
     center_lon = (bounds[0] + bounds[2]) / 2
     
@@ -206,7 +738,8 @@ def create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trail
         zoom_control=True,
         scrollWheelZoom=True,
         doubleClickZoom=True,
-        tiles=None
+        tiles=None,
+        prefer_canvas=renderer == "canvas",
     )
     ## location
     # Add locate control to show current position
@@ -218,29 +751,46 @@ def create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trail
             'popup': 'Your position'
         }
     ).add_to(m)
+    # local_tiles swaps a basemap for a locally cached copy; past the cached zoom
+    # levels Leaflet scales up the deepest cached tile instead of showing nothing
+    local_tiles = local_tiles or {}
+
+    def local_tile_options(name, attr=None):
+        options = {}
+        if name in local_tiles:
+            # named folium tiles bring their own attribution, a local url needs one
+            if attr is not None:
+                options['attr'] = attr
+            if local_tiles_max_zoom is not None:
+                options['max_native_zoom'] = local_tiles_max_zoom
+        return options
+
     # Add base layers
     folium.TileLayer(
-        tiles='OpenStreetMap',
+        tiles=local_tiles.get('Street Map', 'OpenStreetMap'),
         name='Street Map',
         overlay=False,
         control=True,
         show = False,
+        **local_tile_options('Street Map', attr='OpenStreetMap'),
     ).add_to(m)
     # Add base layers
     folium.TileLayer(
-        tiles="Cartodb Positron",
+        tiles=local_tiles.get('Simple Carto', "Cartodb Positron"),
         name='Simple Carto',
         overlay=False,
         control=True,
         show = False,
+        **local_tile_options('Simple Carto', attr='CartoDB'),
     ).add_to(m)
     folium.TileLayer(
-        tiles='https://basemap.nationalmap.gov/arcgis/rest/services/USGSTopo/MapServer/tile/{z}/{y}/{x}',
+        tiles=local_tiles.get('USGS Topo', 'https://basemap.nationalmap.gov/arcgis/rest/services/USGSTopo/MapServer/tile/{z}/{y}/{x}'),
         attr='USGS',
         name='USGS Topo',
         overlay=False,
         control=True,
         show = True,
+        **local_tile_options('USGS Topo'),
     ).add_to(m)
 
     m.get_root().html.add_child(folium.Element("""
@@ -252,115 +802,69 @@ def create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trail
     """))
     # CartoDB Dark Matter (dark theme)
     folium.TileLayer(
-        tiles="Cartodb dark_matter",
+        tiles=local_tiles.get('Dark Carto', "Cartodb dark_matter"),
         name='Dark Carto',
         overlay=False,
         control=True,
         show=False,
+        **local_tile_options('Dark Carto', attr='CartoDB'),
     ).add_to(m)
  
     folium.TileLayer(
-        tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        tiles=local_tiles.get('Satellite', 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}'),
         attr='Esri',
         name='Satellite',
         overlay=False,
         control=True,
-        show=False
+        show=False,
+        **local_tile_options('Satellite'),
     ).add_to(m)
     
-    # wa trailheads
-    if wa_trailheads is not None and not wa_trailheads.empty:
-        wa_trailheads_layer = folium.FeatureGroup(name='WA Trailheads', show=True)
-        folium.GeoJson(
-            wa_trailheads,
-            marker=folium.Circle(
-                radius=50,  # Radius in meters (for actual geographic size)
-                fill=True,
-                fillColor='#20B2AA',
-                fillOpacity=0.7,
-                color='black',
-                weight=1
-            ),
-            tooltip="WA Trailheads"
-        ).add_to(wa_trailheads_layer)
-        wa_trailheads_layer.add_to(m)
-    
-    # wa_trails layer will have multiple components
-    if wa_federal_trails is not None and not wa_federal_trails.empty:
-        wa_trails_layer = folium.FeatureGroup(name='WA Federal Trails', show=True)
-        folium.GeoJson(
-            wa_federal_trails,
-            style_function=lambda x: {
-                'fillColor': 'transparent',
-                'color': 'green',  # Changed to green
-                'weight': 2,
-                # 'dashArray': '10, 5',  # Removed for solid line
-                'fillOpacity': 0
-            },
-            tooltip="WA Federal Trails"
-        ).add_to(wa_trails_layer)
-        wa_trails_layer.add_to(m)
+    if vector_tile_url is not None:
+        add_vector_tile_layers(m, vector_tile_url, layers.keys())
+        add_search_control(m, layers)
+        folium.LayerControl(collapsed=False, show=False).add_to(m)
+        m.conflate_stats = conflate_stats
+        m.simplify_stats = simplify_stats
+        m.quantize_stats = quantize_stats
+        return m
 
-    # wa_ other trails layer will have multiple components
-    if wa_other_trails is not None and not wa_other_trails.empty:
-        wa_other_trails_layer = folium.FeatureGroup(name='WA Other Trails', show=True)
-        folium.GeoJson(
-            wa_other_trails,
-            style_function=lambda x: {
-                'fillColor': 'transparent',
-                'color': '#83D683',  # Changed to green
-                'weight': 2,
-                # 'dashArray': '10, 5',  # Removed for solid line
-                'fillOpacity': 0
-            },
-            tooltip="WA Other Trails"
-        ).add_to(wa_other_trails_layer)
-        wa_other_trails_layer.add_to(m)
-
-    # wa_ other trails layer will have multiple components
-    if wa_state_trails is not None and not wa_state_trails.empty:
-        wa_state_trails_layer = folium.FeatureGroup(name='WA State Trails', show=True)
-        folium.GeoJson(
-            wa_state_trails,
-            style_function=lambda x: {
-                'fillColor': 'transparent',
-                'color': '#6AD44E',  # Changed to green
-                'weight': 2,
-                # 'dashArray': '10, 5',  # Removed for solid line
-                'fillOpacity': 0
-            },
-            tooltip="WA State Trails"
-        ).add_to(wa_state_trails_layer)
-        wa_state_trails_layer.add_to(m)
-    # Add WA State Parks
-    if wa_state_parks is not None and not wa_state_parks.empty:
-        wa_state_parks_layer = folium.FeatureGroup(name='WA State Parks', show=False)
-        folium.GeoJson(
-            wa_state_parks,
-            style_function=lambda x: {
-                'fillColor': '#9ACD32',  # Yellow-green (not too bright)
-                'color': '#9ACD32',  # Border color
-                'weight': 2,  # 2 point border
-                'fillOpacity': 0.3  # Pretty transparent
-            },
-            tooltip="WA State Parks"
-        ).add_to(wa_state_parks_layer)
-        wa_state_parks_layer.add_to(m)
-
-    if wa_winter_trails is not None and not wa_winter_trails.empty:
-        wa_winter_trails_layer = folium.FeatureGroup(name='Washington State Winter Non-Motorized Trails', show=True)
-        folium.GeoJson(
-            wa_winter_trails,
-            style_function=lambda x: {
-                'fillColor': 'transparent',
-                'color': '#AF6D23',
-                'weight': 2,
-                'dashArray': '10, 5',
-                'fillOpacity': 0
-            },
-            tooltip="Washington State Winter Non-Motorized Trails"
-        ).add_to(wa_winter_trails_layer)
-        wa_winter_trails_layer.add_to(m)
+    m.layer_files = dict(layer_files or {})
+    for key in WA_LAYERS:
+        if key in layers and layer_data_dir is not None:
+            with stage(f"serialize {key}") as serialize_stage:
+                m.layer_files[key], serialize_stage.info["bytes"] = write_layer_data(layers[key], key, layer_data_dir)
+            if lod_levels and WA_LAYERS[key]["simplify"]:
+                levels = []
+                for min_zoom, tolerance in lod_levels:
+                    if tolerance is None:
+                        levels.append([min_zoom, m.layer_files[key]])
+                        continue
+                    with stage(f"generalize {key} z{min_zoom}") as lod_stage:
+                        level_gdf, _ = simplify_layer(lod_sources[key], tolerance, f"{WA_LAYERS[key]['name']} z{min_zoom}")
+                        level_gdf = lod_stage.count(quantize_coordinates(level_gdf, coordinate_decimals))
+                        level_file, _ = write_layer_data(level_gdf, f"{key}.z{min_zoom}", layer_data_dir)
+                    levels.append([min_zoom, level_file])
+                m.layer_files[key] = levels
+            detail_file = _detail_file(m.layer_files[key])
+            if WA_LAYERS[key].get("cluster"):
+                write_cluster_data(
+                    build_cluster_hierarchy(layers[key], **WA_LAYERS[key]["cluster"]),
+                    detail_file,
+                    layer_data_dir,
+                )
+            if WA_LAYERS[key].get("search"):
+                # always written (empty when the source has no name field) so build_map sees it
+                write_search_index(
+                    build_search_index(layers[key], WA_LAYERS[key]["search"]),
+                    detail_file,
+                    layer_data_dir,
+                )
+            add_external_registry_layer(m, key, m.layer_files[key], layer_data_url)
+        elif key in layers:
+            add_registry_layer(m, key, layers[key])
+        elif key in m.layer_files:
+            add_external_registry_layer(m, key, m.layer_files[key], layer_data_url)
     
    
     
@@ -369,76 +873,195 @@ def create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trail
     #wtd_sites = sites_gdf[sites_gdf["WTD Service Area"] == True]
     #add_sites_colored_by_parameter(m, sites_gdf, layer_name='Sites by Parameter', show=True, radius=6)
     # discharge sites
+
+    add_search_control(m, layers, m.layer_files if layer_data_dir is not None or layer_files else None, layer_data_url)
    
     # Add layer control
     folium.LayerControl(collapsed=False, show=False).add_to(m)
-    
+
+    m.conflate_stats = conflate_stats
+    m.simplify_stats = simplify_stats
+    m.quantize_stats = quantize_stats
     return m
 
 
-def save_map_screenshot(html_path, output_path, pdf_path, window_size=(729, 943)):
-    """Save map as static PNG screenshot"""
-    
-    # Read original HTML
-    with open(html_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Create static version
-    static_code = """
-    <style>
-    .leaflet-container {
-        cursor: default !important;
-        pointer-events: none !important;
-    }
-    .leaflet-control-zoom,
-    .leaflet-control-attribution,
-    .leaflet-control-layers {
-        display: none !important;
-    }
-    </style>
-    </head>
+def layer_data_files(key, file_name):
+    """every file the external map needs for a layer: its data file(s) plus cluster/search sidecars"""
+    config = WA_LAYERS[key]
+    if isinstance(file_name, list):
+        files = [level_file for _, level_file in file_name]
+    else:
+        files = [file_name]
+    file_name = _detail_file(file_name)
+    if config.get("cluster"):
+        files.append(cluster_file_name(file_name))
+    if config.get("search"):
+        files.append(search_file_name(file_name))
+    return files
+
+
+def prune_layer_data(layer_data_dir, entries, keys):
+    """Delete old hashed versions of keys' files ({key}.*) in layer_data_dir that no manifest entry references.
+
+    Files of other layers are left alone, so building one map variant never
+    removes data another variant's html still points at. Returns the names
+    of the removed files.
     """
-    
-    static_html = html_content.replace('</head>', static_code)
-    
-    # Save static version to temporary file
-    static_html_path = html_path.replace('.html', '_static.html')
-    with open(static_html_path, 'w', encoding='utf-8') as f:
-        f.write(static_html)
-    
-    # Take screenshot of static version
-    chrome_options = Options()
-    chrome_options.add_argument('--headless')
-    chrome_options.add_argument('--disable-gpu')
-    chrome_options.add_argument(f'--window-size={window_size[0]},{window_size[1]}')
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    html_uri = Path(static_html_path).resolve().as_uri()
-    driver.get(html_uri)
-    time.sleep(2)
-    driver.save_screenshot(output_path)
-  
+    referenced = set()
+    for key, entry in entries.items():
+        if entry.get("file"):
+            for file_name in layer_data_files(key, entry["file"]):
+                referenced.update((file_name, f"{file_name}.gz", f"{file_name}.br"))
 
-    
+    removed = []
+    for path in Path(layer_data_dir).glob("*"):
+        if (path.is_file() and path.name not in referenced
+                and any(path.name.startswith(f"{key}.") for key in keys)):
+            path.unlink()
+            removed.append(path.name)
+    if removed:
+        print(f"removed {len(removed)} unreferenced layer data files")
+    return removed
 
-    # Wait for page to render (optional)
-    time.sleep(2)
 
-    # Use Chrome DevTools Protocol (CDP) to print to PDF
-    pdf = driver.execute_cdp_cmd("Page.printToPDF", {
-        "printBackground": True,
-        "landscape": False
-    })
+def _json_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
 
-    # Save the base64-encoded PDF data to file
-    with open(pdf_path, "wb") as f:
-        f.write(base64.b64decode(pdf['data']))
 
-    driver.quit()
+def build_map(keys=None, html_path="data/wa_map.html", layer_data_dir="data/wa_layers", layer_data_url="wa_layers",
+              manifest_path="data/build_manifest.json", simplify_tolerance=5, coordinate_decimals=5, max_workers=None,
+              local_tiles=None, conflate_tolerance=None, lod_levels=None):
+    """Incrementally rebuild the external-data map, redoing only layers whose inputs changed.
 
-   
-    # Optionally remove temporary static file
-    # os.remove(static_html_path)
+    The manifest records, per layer, the source file's size/mtime/sha256, an
+    input hash (source content plus everything that shapes the data file:
+    columns, crs, simplification and precision), a style hash and the data
+    file written for it. A layer is re-imported and re-written only when its
+    input hash changed or its data file is missing; style-only changes just
+    reassemble the html, which never needs the layer data. Conflated trail
+    layers also depend on every higher priority trail layer, so those are
+    hashed into their input and re-loaded alongside them. Layers that load
+    empty are recorded as such and get no data file. Entries for layers
+    outside keys are kept in the manifest, and only the rebuilt layers' old
+    data files are deleted, so map variants can share one manifest and data
+    directory. Returns the map.
+    """
+    start = time.perf_counter()
+    keys = [key for key in WA_LAYERS if keys is None or key in keys]
+
+    manifest = {"layers": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    previous = manifest["layers"]
+
+    entries = {}
+    stale = []
+    for key in keys:
+        config = WA_LAYERS[key]
+        source_path = str(Path(config["source"]).resolve())
+        stat = os.stat(source_path)
+        entry = {"source": source_path, "size": stat.st_size, "mtime": stat.st_mtime}
+        old = previous.get(key, {})
+        # only hash the source when size or mtime moved
+        if all(old.get(k) == entry[k] for k in ("source", "size", "mtime")):
+            entry["sha256"] = old["sha256"]
+        else:
+            entry["sha256"] = _file_hash(source_path)
+        entries[key] = entry
+
+    for key in keys:
+        config = WA_LAYERS[key]
+        entry = entries[key]
+        old = previous.get(key, {})
+        entry["input_hash"] = _json_hash({
+            "sha256": entry["sha256"],
+            "columns": config.get("columns"),
+            "crs": config.get("crs", "EPSG:4326"),
+            "clean_datetimes": config.get("clean_datetimes", False),
+            "simplify_tolerance": simplify_tolerance if config["simplify"] else None,
+            "coordinate_decimals": coordinate_decimals,
+            "cluster": config.get("cluster"),
+            "search": config.get("search"),
+            "lod_levels": lod_levels if config["simplify"] else None,
+            "conflate": (conflate_tolerance, [
+                entries[other]["sha256"] for other in keys
+                if WA_LAYERS[other].get("conflate") and WA_LAYERS[other]["conflate"] < config["conflate"]
+            ]) if conflate_tolerance and config.get("conflate") else None,
+        })
+        entry["style_hash"] = _json_hash({k: config.get(k) for k in ("name", "style", "tooltip", "show", "geometry")})
+
+        if old.get("input_hash") == entry["input_hash"] and old.get("empty"):
+            # loaded empty last time and nothing changed: still nothing to draw
+            entry["empty"] = True
+        elif (old.get("input_hash") == entry["input_hash"] and old.get("file")
+                and all(os.path.exists(os.path.join(layer_data_dir, file_name))
+                        for file_name in layer_data_files(key, old["file"]))):
+            entry["file"] = old["file"]
+            entry["bounds"] = old["bounds"]
+        else:
+            stale.append(key)
+
+    print(f"rebuilding {len(stale)} of {len(keys)} layers: {', '.join(stale) or 'none'}")
+    load_keys = list(stale)
+    if conflate_tolerance:
+        # a stale trail layer is deduplicated against the trail layers ranked above it
+        stale_ranks = [WA_LAYERS[key]["conflate"] for key in stale if WA_LAYERS[key].get("conflate")]
+        load_keys += [
+            key for key in keys
+            if key not in stale and WA_LAYERS[key].get("conflate") and stale_ranks
+            and WA_LAYERS[key]["conflate"] < max(stale_ranks)
+        ]
+    layers = {}
+    if load_keys:
+        with stage("load layers"):
+            layers, _ = load_wa_layers(load_keys, max_workers=1 if len(load_keys) == 1 else max_workers)
+        for key, gdf in layers.items():
+            if gdf is not None and not gdf.empty:
+                entries[key]["bounds"] = [float(v) for v in gdf.total_bounds]
+
+    if "bounds" in entries.get("wa_trailheads", {}):
+        bounds = entries["wa_trailheads"]["bounds"]
+    elif any("bounds" in entry for entry in entries.values()):
+        bounds = gpd.GeoSeries([box(*entry["bounds"]) for entry in entries.values() if "bounds" in entry]).total_bounds
+    else:
+        bounds = None
+
+    with stage("create map"):
+        m = create_map(
+            layers,
+            simplify_tolerance=simplify_tolerance,
+            coordinate_decimals=coordinate_decimals,
+            layer_data_dir=layer_data_dir,
+            layer_data_url=layer_data_url,
+            layer_files={key: entry["file"] for key, entry in entries.items() if "file" in entry},
+            bounds=bounds,
+            local_tiles=local_tiles,
+            conflate_tolerance=conflate_tolerance,
+            lod_levels=lod_levels,
+        )
+    with stage("save html"):
+        m.save(html_path)
+
+    for key in keys:
+        if key in m.layer_files:
+            entries[key]["file"] = m.layer_files[key]
+        else:
+            # create_map skips layers that load empty; record them so they aren't rebuilt every run
+            entries[key]["empty"] = True
+            entries[key].pop("bounds", None)
+    # other variants' layers stay in the shared manifest
+    manifest = {
+        "html": html_path,
+        "html_sha256": _file_hash(html_path),
+        "layers": {**previous, **entries},
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    prune_layer_data(layer_data_dir, manifest["layers"], keys)
+
+    print(f"built {html_path} in {time.perf_counter() - start:.1f}s")
+    return m
 
 
 # Main execution
@@ -446,27 +1069,79 @@ if __name__ == "__main__":
     # Import data
     #sites_gdf = site_import(file_path="WTD_map/data/WTD_LTM_Gages.xlsx")
 
-    wa_trailheads = wa_trailheads_import()
-    wa_federal_trails =  wa_federal_trails_import()
-    wa_other_trails = wa_other_trails_import()
-    wa_state_trails = wa_state_trails_import()
-    wa_winter_trails = wa_winter_trails_import()
-    wa_state_parks = wa_state_parks_import()
-    # Process data
- 
-    
+    # layers drawn on this map variant; anything left out is never read
+    map_layers = list(WA_LAYERS)
+
+    # per-stage time/memory report, written to build_stats.REPORT_DIR at the end
+    start_run("ski_map")
+
+    # basemap from the local MBTiles cache (filled by tile_cache.prefetch_basemaps):
+    # "exported" copies the USGS tiles next to the html (data/basemaps) and points the published
+    # map at them with relative urls, so it also works offline; "server" serves them on
+    # localhost for the screenshot only, from a separate screenshot html, since nobody else
+    # can reach that server. None keeps the remote tile servers
+    local_tiles_mode = None
+    html_outputs = [("data/wa_map.html", None)]
+    if local_tiles_mode == "exported":
+        export_tile_directory(f"{TILE_CACHE_DIR}/usgs_topo.mbtiles", "data/basemaps/usgs_topo")
+        html_outputs = [("data/wa_map.html", local_tile_urls("basemaps", ["USGS Topo"], cache_dir=TILE_CACHE_DIR))]
+    elif local_tiles_mode == "server":
+        tile_server = start_tile_server(TILE_CACHE_DIR, port=8765)
+        html_outputs.append(("data/wa_map_screenshot.html",
+                             local_tile_urls("http://localhost:8765", ["USGS Topo"], cache_dir=TILE_CACHE_DIR)))
+    # the browser screenshot uses the last html written
+    screenshot_html = html_outputs[-1][0]
+
     # Create and save map
-    m = create_map(wa_trailheads, wa_federal_trails, wa_other_trails, wa_state_trails, wa_winter_trails, wa_state_parks)
-    m.save("data/wa_map.html")
+    # "geojson" inlines every layer in the html, "tiles" writes an MVT pyramid next to it,
+    # "external" writes one cacheable data file per layer that the page fetches and
+    # only rebuilds the layers whose source changed since the last run
+    output_mode = "geojson"
+    if output_mode == "external":
+        with stage("build map"):
+            # a second build only reassembles the html, the layer data is already up to date
+            for html_path, tiles in html_outputs:
+                m = build_map(map_layers, html_path=html_path, max_workers=6, local_tiles=tiles, conflate_tolerance=10,
+                              lod_levels=[(0, 200), (9, 50), (12, None)])
+    else:
+        # read and reproject the layers in parallel
+        with stage("load layers"):
+            layers, layer_timings = load_wa_layers(map_layers, max_workers=6)
+        if output_mode == "tiles":
+            with stage("vector tiles"):
+                build_vector_tiles(layers, "data/wa_tiles", min_zoom=6, max_zoom=14)
+        for html_path, tiles in html_outputs:
+            with stage("create map"):
+                if output_mode == "tiles":
+                    m = create_map(layers, vector_tile_url="wa_tiles/{layer}/{z}/{x}/{y}.pbf", local_tiles=tiles)
+                else:
+                    m = create_map(layers, simplify_tolerance=5, coordinate_decimals=5, local_tiles=tiles, conflate_tolerance=10)
+            with stage("save html"):
+                m.save(html_path)
     
     
     # Save screenshot
-    save_map_screenshot(
-        html_path='data/wa_map.html',
-        output_path='data/wa_map.png',
-        pdf_path='data/wa_map.pdf',
-        window_size=(729, 943)
-    )
+    # "browser" screenshots the saved html in headless Chrome, "static" draws the
+    # layers with matplotlib (no browser, vector pdf) over the cached USGS basemap
+    screenshot_backend = "browser"
+    with stage("screenshot"):
+        if screenshot_backend == "static":
+            if output_mode == "external":
+                layers, _ = load_wa_layers(map_layers, max_workers=6)
+            render_static_map(
+                layers,
+                WA_LAYERS,
+                output_path='data/wa_map.png',
+                pdf_path='data/wa_map.pdf',
+                basemap=f"{TILE_CACHE_DIR}/usgs_topo.mbtiles",
+            )
+        else:
+            save_map_screenshot(
+                html_path=screenshot_html,
+                output_path='data/wa_map.png',
+                pdf_path='data/wa_map.pdf',
+                window_size=(729, 943)
+            )
     
     # remove wtd basins from mapping
     basins_filter = None
@@ -478,5 +1153,6 @@ if __name__ == "__main__":
     #    pdf_path='data/isp_map.pdf',
     #    window_size=(729, 943)
     #)
+    write_report()
     print("Map generation complete!")
    
\ No newline at end of file
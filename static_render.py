@@ -0,0 +1,256 @@
+import io
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
+from shapely.geometry import box
+
+from map_output import PAGE_SIZES
+from vector_tiles import ORIGIN_SHIFT
+
+# Leaflet sizes are css pixels, matplotlib sizes are points
+PX_TO_PT = 72 / 96
+TILE_SIZE = 256
+
+# layers in EPSG:3857 and the registry, set once per process by _init_worker
+_worker_layers = {}
+_worker_registry = {}
+
+
+def _page_inches(size="letter", orientation="portrait"):
+    """(width, height) in inches of a PAGE_SIZES name or an explicit (width, height) in inches"""
+    width, height = PAGE_SIZES[size] if isinstance(size, str) else size
+    if orientation == "landscape":
+        width, height = max(width, height), min(width, height)
+    return width, height
+
+
+def _fit_extent(bounds, aspect):
+    """grow web mercator bounds to the page aspect ratio (width / height), keeping the center"""
+    minx, miny, maxx, maxy = bounds
+    width, height = maxx - minx, maxy - miny
+    if width / height < aspect:
+        pad = (height * aspect - width) / 2
+        minx, maxx = minx - pad, maxx + pad
+    else:
+        pad = (width / aspect - height) / 2
+        miny, maxy = miny - pad, maxy + pad
+    return minx, miny, maxx, maxy
+
+
+def _dashes(dash_array):
+    """Leaflet dashArray ("10, 5") as a matplotlib linestyle"""
+    if not dash_array:
+        return "solid"
+    return (0, tuple(float(v) * PX_TO_PT for v in str(dash_array).replace(",", " ").split()))
+
+
+def _basemap_image(mbtiles_path, extent, size_px):
+    """mosaic MBTiles basemap tiles covering extent at the zoom closest to the output resolution,
+    cropped and scaled to size_px (width, height); None if the file has no tiles"""
+    minx, miny, maxx, maxy = extent
+    zoom = int(round(math.log2(2 * ORIGIN_SHIFT * size_px[0] / (TILE_SIZE * (maxx - minx)))))
+    conn = sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True)
+    try:
+        available = conn.execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+        if available[0] is None:
+            return None
+        zoom = min(max(zoom, available[0]), available[1])
+        tile_m = 2 * ORIGIN_SHIFT / 2 ** zoom
+        x0, x1 = int((minx + ORIGIN_SHIFT) // tile_m), int((maxx + ORIGIN_SHIFT) // tile_m)
+        y0, y1 = int((ORIGIN_SHIFT - maxy) // tile_m), int((ORIGIN_SHIFT - miny) // tile_m)
+
+        mosaic = Image.new("RGB", ((x1 - x0 + 1) * TILE_SIZE, (y1 - y0 + 1) * TILE_SIZE), "white")
+        rows = conn.execute(
+            "SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level = ? "
+            "AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+            (zoom, x0, x1, 2 ** zoom - 1 - y1, 2 ** zoom - 1 - y0),
+        )
+        for x, tms_y, data in rows:
+            # png or jpeg, palette or grayscale: PIL sniffs the format and converts to RGB
+            tile = Image.open(io.BytesIO(data)).convert("RGB")
+            y = 2 ** zoom - 1 - tms_y
+            mosaic.paste(tile, ((x - x0) * TILE_SIZE, (y - y0) * TILE_SIZE))
+    finally:
+        conn.close()
+
+    # crop and scale to the page's pixels once here instead of letting matplotlib resample per output
+    px_per_m = TILE_SIZE / tile_m
+    crop = (
+        (minx - (x0 * tile_m - ORIGIN_SHIFT)) * px_per_m,
+        ((ORIGIN_SHIFT - y0 * tile_m) - maxy) * px_per_m,
+        (maxx - (x0 * tile_m - ORIGIN_SHIFT)) * px_per_m,
+        ((ORIGIN_SHIFT - y0 * tile_m) - miny) * px_per_m,
+    )
+    return mosaic.resize(size_px, Image.BILINEAR, box=crop)
+
+
+def _draw_layer(ax, gdf, config, extent, width_px, zorder):
+    """draw one layer with its Leaflet style"""
+    style = config["style"]
+    visible = gdf.iloc[gdf.sindex.query(box(*extent), predicate="intersects")]
+    if visible.empty:
+        return
+
+    if config["geometry"] == "line":
+        parts = shapely.get_parts(visible.geometry.values)
+        segments = [np.asarray(part.coords)[:, :2] for part in parts if not part.is_empty]
+        ax.add_collection(LineCollection(
+            segments,
+            colors=style.get("color", "#3388ff"),
+            linewidths=style.get("weight", 3) * PX_TO_PT,
+            linestyles=_dashes(style.get("dashArray")),
+            alpha=style.get("opacity", 1.0),
+            zorder=zorder,
+        ))
+    elif config["geometry"] == "polygon":
+        visible.plot(
+            ax=ax,
+            facecolor=style.get("fillColor", style.get("color", "#3388ff")),
+            edgecolor="none",
+            alpha=style.get("fillOpacity", 0.2),
+            zorder=zorder,
+        )
+        visible.boundary.plot(
+            ax=ax,
+            color=style.get("color", "#3388ff"),
+            linewidth=style.get("weight", 3) * PX_TO_PT,
+            zorder=zorder,
+        )
+    else:
+        # radius is in metres like folium.Circle; keep points visible on overview pages
+        metres_per_px = (extent[2] - extent[0]) / width_px
+        center_lat = math.degrees(math.atan(math.sinh(((extent[1] + extent[3]) / 2) / 6378137)))
+        radius_px = style.get("radius", 10) / math.cos(math.radians(center_lat)) / metres_per_px
+        radius_pt = max(radius_px * PX_TO_PT, 1.5)
+        points = visible.geometry.representative_point()
+        ax.scatter(
+            points.x, points.y,
+            s=(2 * radius_pt) ** 2,
+            facecolor=style.get("fillColor", style.get("color", "#3388ff")),
+            edgecolor=style.get("color", "#3388ff"),
+            linewidths=style.get("weight", 1) * PX_TO_PT,
+            alpha=style.get("fillOpacity", 0.2) if style.get("fill", True) else 1.0,
+            zorder=zorder,
+        )
+
+
+def _render(layers, registry, output_path=None, pdf_path=None, size="letter", orientation="portrait",
+            bounds=None, dpi=150, basemap=None):
+    start = time.perf_counter()
+    width_in, height_in = _page_inches(size, orientation)
+    if bounds is not None:
+        extent = gpd.GeoSeries([box(*bounds)], crs="EPSG:4326").to_crs("EPSG:3857").total_bounds
+    else:
+        extent = gpd.GeoSeries([box(*gdf.total_bounds) for gdf in layers.values()], crs="EPSG:3857").total_bounds
+    extent = _fit_extent(extent, width_in / height_in)
+    width_px = width_in * dpi
+    # the pixel size agg renders at
+    size_px = (int(width_in * dpi), int(height_in * dpi))
+    basemap_image = None
+    if basemap is not None and os.path.exists(basemap):
+        basemap_image = _basemap_image(basemap, extent, size_px)
+
+    fig = Figure(figsize=(width_in, height_in))
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    for zorder, (key, gdf) in enumerate(layers.items(), start=1):
+        _draw_layer(ax, gdf, registry[key], extent, width_px, zorder)
+    ax.set_xlim(extent[0], extent[2])
+    ax.set_ylim(extent[1], extent[3])
+    ax.set_aspect("equal")
+
+    # zlib level 1: a little bigger than the default 6, several times faster to encode
+    if output_path and basemap_image is None:
+        fig.savefig(output_path, dpi=dpi, pil_kwargs={"compress_level": 1})
+    elif output_path:
+        # agg resamples an imshow image even at 1:1, so render only the layers and composite them
+        # over the already page-sized basemap
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="raw", dpi=dpi, transparent=True)
+        overlay = Image.frombuffer("RGBA", size_px, buffer.getbuffer(), "raw", "RGBA", 0, 1)
+        page = Image.alpha_composite(basemap_image.convert("RGBA"), overlay).convert("RGB")
+        page.save(output_path, dpi=(dpi, dpi), compress_level=1)
+    if pdf_path:
+        # vector pdf; only the basemap is embedded as an image, at its pixel size
+        if basemap_image is not None:
+            ax.imshow(np.asarray(basemap_image.convert("RGBA")), extent=(extent[0], extent[2], extent[1], extent[3]),
+                      interpolation="none", zorder=0)
+        fig.savefig(pdf_path)
+    return {"render_s": time.perf_counter() - start}
+
+
+def prepare_layers(layers, registry, keys=None):
+    """registry layers to draw (default: the ones shown when the map opens) in web mercator, in registry order"""
+    return {
+        key: layers[key].to_crs("EPSG:3857")
+        for key in registry
+        if key in layers and layers[key] is not None and not layers[key].empty
+        and (key in keys if keys is not None else registry[key].get("show", True))
+    }
+
+
+def render_static_map(layers, registry, output_path=None, pdf_path=None, size="letter", orientation="portrait",
+                      bounds=None, dpi=150, basemap=None, keys=None):
+    """Draw registry layers straight to PNG and/or vector PDF with matplotlib, no browser needed.
+
+    layers and registry are create_map's inputs (e.g. ski_map.WA_LAYERS), so
+    colors, line weights and dashes match the web map. size is a PAGE_SIZES
+    name or (width, height) in inches; bounds ((west, south, east, north))
+    crops to a region, otherwise the page covers every layer. basemap is an
+    MBTiles file (see tile_cache.prefetch_basemaps) drawn underneath. keys
+    picks layers, default is the layers shown when the web map opens.
+    Returns a dict of timings in seconds.
+    """
+    return _render(prepare_layers(layers, registry, keys), registry, output_path, pdf_path, size, orientation,
+                   bounds, dpi, basemap)
+
+
+def _init_worker(layers, registry):
+    global _worker_layers, _worker_registry
+    _worker_layers = layers
+    _worker_registry = registry
+
+
+def _render_job(job):
+    entry = {key: job.get(key) for key in ("output_path", "pdf_path", "size", "orientation", "bounds")}
+    try:
+        entry["timings"] = _render(
+            _worker_layers,
+            _worker_registry,
+            job.get("output_path"),
+            job.get("pdf_path"),
+            job.get("size", "letter"),
+            job.get("orientation", "portrait"),
+            job.get("bounds"),
+            job.get("dpi", 150),
+            job.get("basemap"),
+        )
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        print(f"Error rendering {job.get('output_path') or job.get('pdf_path')}: {e}")
+    return entry
+
+
+def render_static_batch(jobs, layers, registry, max_workers=None, keys=None):
+    """Render many pages in a process pool.
+
+    Jobs are dicts like map_screenshots.render_batch jobs (output_path,
+    pdf_path, size, orientation, bounds) plus optional dpi and basemap.
+    Layers are projected once and handed to each worker when it starts.
+    Returns the jobs with their timings or error.
+    """
+    start = time.perf_counter()
+    layers = prepare_layers(layers, registry, keys)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(layers, registry)) as executor:
+        manifest = list(executor.map(_render_job, jobs))
+    print(f"rendered {len(manifest)} static pages in {time.perf_counter() - start:.1f}s")
+    return manifest
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+from pyogrio.raw import open_arrow
+from pyproj import CRS
+
+# features per Arrow record batch; bounds peak memory whatever the source size
+BATCH_SIZE = 50_000
+
+
+def _geo_metadata(crs):
+    """GeoParquet 1.0 "geo" schema metadata for a WKB geometry column"""
+    return json.dumps({
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {
+            "geometry": {
+                "encoding": "WKB",
+                "geometry_types": [],
+                "crs": CRS(crs).to_json_dict() if crs is not None else None,
+            }
+        },
+    })
+
+
+def stream_to_parquet(source_path, parquet_path, columns=None, bbox=None, mask=None, mask_crs="EPSG:4326",
+                      crs=None, clip=False, clean_datetimes=False, batch_size=BATCH_SIZE):
+    """Convert a vector file to GeoParquet in bounded batches, without ever holding the whole layer.
+
+    Features are read as Arrow record batches of batch_size. columns, bbox
+    and mask (in mask_crs) are pushed down into the reader; clip=True also
+    cuts each batch's geometries to the mask. Each batch is then reprojected
+    to crs and appended to parquet_path with a ParquetWriter, so peak memory
+    depends on batch_size, not on the size of the source. Returns the number
+    of rows written.
+    """
+    start = time.perf_counter()
+    os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
+    source_crs = pyogrio.read_info(source_path)["crs"]
+    crs = crs or source_crs
+
+    # the reader filters in the source crs
+    if bbox is not None:
+        bbox = tuple(gpd.GeoSeries([shapely.box(*bbox)], crs=mask_crs).to_crs(source_crs).total_bounds)
+    if mask is not None:
+        mask = gpd.GeoSeries([mask], crs=mask_crs).to_crs(source_crs).iloc[0]
+        shapely.prepare(mask)
+
+    Path(parquet_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{parquet_path}.tmp"
+    writer = None
+    rows = 0
+    batches = 0
+    try:
+        with open_arrow(source_path, columns=columns, bbox=bbox, mask=mask, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+            geometry_name = meta["geometry_name"] or "wkb_geometry"
+            for batch in reader:
+                batches += 1
+                geoms = shapely.from_wkb(batch.column(geometry_name).to_numpy(zero_copy_only=False))
+                if clip and mask is not None:
+                    geoms = shapely.intersection(geoms, mask)
+                    keep = ~shapely.is_empty(geoms)
+                    batch = batch.filter(pa.array(keep))
+                    geoms = geoms[keep]
+                if len(geoms) == 0:
+                    continue
+                if crs != source_crs:
+                    geoms = gpd.GeoSeries(geoms, crs=source_crs).to_crs(crs).values
+
+                table = pa.Table.from_batches([batch]).drop_columns([geometry_name])
+                if clean_datetimes:
+                    for i, field in enumerate(table.schema):
+                        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+                            table = table.set_column(i, field.name, pc.cast(table.column(i), pa.string()))
+                table = table.append_column("geometry", pa.array(shapely.to_wkb(np.asarray(geoms)), pa.binary()))
+
+                if writer is None:
+                    schema = table.schema.with_metadata({b"geo": _geo_metadata(crs).encode("utf-8")})
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # nothing matched; still leave a valid, empty layer behind
+        gpd.GeoDataFrame(geometry=[], crs=crs).to_parquet(tmp_path)
+    os.replace(tmp_path, parquet_path)
+    print(f"streamed {rows} features from {Path(source_path).name} in {batches} batches "
+          f"in {time.perf_counter() - start:.1f}s")
+    return rows
+
+
+def read_streamed(source_path, parquet_path=None, **kwargs):
+    """Stream a large source through GeoParquet (see stream_to_parquet) and load the result.
+
+    Without parquet_path the batches go to a temporary file that is removed
+    once loaded, so nothing is left next to the source; pass parquet_path
+    to keep the filtered layer. Either way the source is streamed again on
+    every call, so callers cache the result they build from it.
+    """
+    if parquet_path is not None:
+        stream_to_parquet(source_path, parquet_path, **kwargs)
+        return gpd.read_parquet(parquet_path)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, f"{Path(source_path).stem}.parquet")
+        stream_to_parquet(source_path, tmp_path, **kwargs)
+        return gpd.read_parquet(tmp_path)
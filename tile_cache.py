@@ -0,0 +1,273 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+# basemaps used by ski_map.create_map, keyed by their layer control name
+BASEMAPS = {
+    "USGS Topo": "https://basemap.nationalmap.gov/arcgis/rest/services/USGSTopo/MapServer/tile/{z}/{y}/{x}",
+    "Satellite": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+    "Street Map": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+    "Simple Carto": "https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
+    "Dark Carto": "https://a.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png",
+}
+
+# basemaps whose tiles may be downloaded in bulk and served from a local cache. "Street Map" is
+# left out: the OpenStreetMap tile usage policy forbids prefetching tile.openstreetmap.org.
+# Esri's World_Imagery ("Satellite") terms similarly restrict bulk download and offline use
+# outside an ArcGIS licence, so check them before prefetching it.
+PREFETCH_BASEMAPS = ("USGS Topo", "Satellite", "Simple Carto", "Dark Carto")
+
+# washington state, (west, south, east, north)
+WA_BOUNDS = (-124.85, 45.54, -116.91, 49.0)
+
+# MBTiles "format" metadata value -> Content-Type; USGS/Esri tiles can be jpeg
+TILE_CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+
+
+def lonlat_to_tile(lon, lat, z):
+    """XYZ tile containing a lon/lat at zoom z"""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bounds(bounds, min_zoom, max_zoom):
+    """every (z, x, y) covering (west, south, east, north) between two zoom levels"""
+    west, south, east, north = bounds
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0 = lonlat_to_tile(west, north, z)
+        x1, y1 = lonlat_to_tile(east, south, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def tile_format(data):
+    """MBTiles format name of an image tile, from its magic bytes"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def _set_format(conn, tile_data):
+    """record the format of the tiles actually stored in the MBTiles metadata"""
+    conn.execute("DELETE FROM metadata WHERE name = 'format'")
+    conn.execute("INSERT INTO metadata (name, value) VALUES ('format', ?)", (tile_format(tile_data),))
+
+
+def open_mbtiles(mbtiles_path, name=None):
+    """open (creating if needed) an MBTiles file"""
+    Path(mbtiles_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(mbtiles_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS tiles "
+        "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)"
+    )
+    if name is not None and conn.execute("SELECT 1 FROM metadata WHERE name = 'name'").fetchone() is None:
+        conn.executemany(
+            "INSERT INTO metadata (name, value) VALUES (?, ?)",
+            [("name", name), ("type", "baselayer")],
+        )
+    conn.commit()
+    return conn
+
+
+def prefetch_tiles(url_template, mbtiles_path, bounds=WA_BOUNDS, min_zoom=6, max_zoom=13, max_workers=8, name=None):
+    """Download a basemap's tiles for an extent and zoom range into an MBTiles file.
+
+    Tiles already in the file are skipped, so an interrupted or extended
+    prefetch only fetches what is missing. Downloads run in a thread pool;
+    all writes happen on this thread. Returns the number of tiles added.
+    """
+    if "tile.openstreetmap.org" in url_template:
+        raise ValueError("the OpenStreetMap tile usage policy does not allow prefetching its tiles")
+    start = time.perf_counter()
+    conn = open_mbtiles(mbtiles_path, name=name or Path(mbtiles_path).stem)
+    # mbtiles rows are TMS (y flipped)
+    existing = set(conn.execute("SELECT zoom_level, tile_column, tile_row FROM tiles"))
+    wanted = [
+        (z, x, y) for z, x, y in tiles_for_bounds(bounds, min_zoom, max_zoom)
+        if (z, x, 2 ** z - 1 - y) not in existing
+    ]
+    print(f"prefetching {len(wanted)} tiles into {mbtiles_path}")
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "ski-map tile prefetch"
+
+    def fetch(tile):
+        z, x, y = tile
+        try:
+            response = session.get(url_template.format(z=z, x=x, y=y), timeout=30)
+            if response.status_code == 200:
+                return tile, response.content
+        except requests.RequestException as e:
+            print(f"Error fetching tile {z}/{x}/{y}: {e}")
+        return tile, None
+
+    added = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (z, x, y), data in executor.map(fetch, wanted):
+            if data is None:
+                continue
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (z, x, 2 ** z - 1 - y, data),
+            )
+            if added == 0:
+                _set_format(conn, data)
+            added += 1
+            if added % 500 == 0:
+                conn.commit()
+    conn.commit()
+    conn.close()
+
+    print(f"added {added} tiles in {time.perf_counter() - start:.1f}s")
+    return added
+
+
+def prefetch_basemaps(cache_dir, basemaps=("USGS Topo",), bounds=WA_BOUNDS, min_zoom=6, max_zoom=13, max_workers=8):
+    """prefetch BASEMAPS by name (only those in PREFETCH_BASEMAPS) into {cache_dir}/{name}.mbtiles"""
+    for basemap in basemaps:
+        if basemap not in PREFETCH_BASEMAPS:
+            raise ValueError(f"{basemap} can't be prefetched, see PREFETCH_BASEMAPS")
+        prefetch_tiles(
+            BASEMAPS[basemap],
+            os.path.join(cache_dir, f"{mbtiles_name(basemap)}.mbtiles"),
+            bounds=bounds,
+            min_zoom=min_zoom,
+            max_zoom=max_zoom,
+            max_workers=max_workers,
+            name=basemap,
+        )
+
+
+def mbtiles_name(basemap):
+    """file/url name for a basemap, e.g. "USGS Topo" -> "usgs_topo" """
+    return basemap.lower().replace(" ", "_")
+
+
+def mbtiles_format(mbtiles_path):
+    """tile format recorded in an MBTiles file's metadata (see _set_format), png if none"""
+    conn = sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM metadata WHERE name = 'format'").fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else "png"
+
+
+def export_tile_directory(mbtiles_path, out_dir):
+    """Write an MBTiles file out as a static {z}/{x}/{y}.{format} directory.
+
+    Kept next to the saved html (and pointed at with a relative url, see
+    local_tile_urls) the basemap shows even when the map is opened from
+    device storage with no network. Every tile gets the file's recorded
+    format as its extension so one url template covers them all; browsers
+    decode an odd png among jpgs by its content anyway.
+    """
+    extension = mbtiles_format(mbtiles_path)
+    conn = sqlite3.connect(mbtiles_path)
+    count = 0
+    for z, x, tms_y, data in conn.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"):
+        tile_path = Path(out_dir) / str(z) / str(x) / f"{2 ** z - 1 - tms_y}.{extension}"
+        tile_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tile_path, "wb") as f:
+            f.write(data)
+        count += 1
+    conn.close()
+    print(f"exported {count} tiles to {out_dir}")
+    return count
+
+
+def _tile_handler(cache_dir):
+    """request handler serving /{name}/{z}/{x}/{y}.{ext} from {cache_dir}/{name}.mbtiles, typed by each tile's format"""
+    local = threading.local()
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def _connection(self, name):
+            connections = getattr(local, "connections", None)
+            if connections is None:
+                connections = local.connections = {}
+            if name not in connections:
+                mbtiles_path = os.path.join(cache_dir, f"{name}.mbtiles")
+                if not os.path.exists(mbtiles_path):
+                    return None
+                connections[name] = sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True)
+            return connections[name]
+
+        def do_GET(self):
+            try:
+                name, z, x, y = self.path.strip("/").split("/")
+                z, x, y = int(z), int(x), int(y.split(".")[0])
+            except ValueError:
+                self.send_error(400)
+                return
+
+            conn = self._connection(name)
+            row = None
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                    (z, x, 2 ** z - 1 - y),
+                ).fetchone()
+            if row is None:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", TILE_CONTENT_TYPES[tile_format(row[0])])
+            self.send_header("Content-Length", str(len(row[0])))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "max-age=86400")
+            self.end_headers()
+            self.wfile.write(row[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+
+def start_tile_server(cache_dir, port=8765):
+    """Serve every {name}.mbtiles in cache_dir at http://localhost:{port}/{name}/{z}/{x}/{y}.{ext}.
+
+    Runs on a background thread; call shutdown() on the returned server to stop it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _tile_handler(cache_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"serving tiles from {cache_dir} on http://localhost:{port}")
+    return server
+
+
+def local_tile_urls(base_url, basemaps=PREFETCH_BASEMAPS, cache_dir=None):
+    """Build create_map's local_tiles mapping, basemap name -> {base_url}/{name}/{z}/{x}/{y}.{format}.
+
+    base_url is either the tile server (start_tile_server), which only
+    browsers on this machine can reach, or the directory holding
+    export_tile_directory output, relative to the saved html. The extension
+    is the format recorded in {cache_dir}/{name}.mbtiles, png without
+    cache_dir.
+    """
+    urls = {}
+    for basemap in basemaps:
+        name = mbtiles_name(basemap)
+        extension = mbtiles_format(os.path.join(cache_dir, f"{name}.mbtiles")) if cache_dir else "png"
+        urls[basemap] = f"{base_url}/{name}/{{z}}/{{x}}/{{y}}.{extension}"
+    return urls
@@ -0,0 +1,175 @@
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+
+def _layer_counts(gdf):
+    return len(gdf), int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+
+
+def drop_duplicate_segments(layers, tolerance_m=10, metric_crs="EPSG:32610"):
+    """Drop the parts of trail segments that an earlier (higher priority) layer already draws.
+
+    layers is a dict of layer key -> GeoDataFrame in priority order. Each
+    segment is compared with the segments kept from earlier layers, buffered
+    by tolerance_m; candidates come from a spatial index query, so only
+    nearby pairs are measured. A segment that lies fully within that buffer
+    is dropped; one that runs along it only in places is cut down to the
+    rest, so unique spurs and extensions survive. Overlaps no longer than
+    3 * tolerance_m are crossings or junctions and are kept, and leftover
+    pieces shorter than tolerance_m are slivers along the buffer edge. The
+    feature that absorbs a duplicate lists the duplicate's layer key in an
+    "also_in" column. Returns the layers (same keys and crs), the number of
+    segments dropped and trimmed per layer, and the length in metres each
+    layer still contributes.
+    """
+    metric_layers = {
+        key: gdf.to_crs(metric_crs).reset_index(drop=True)
+        for key, gdf in layers.items()
+    }
+    also_in = {key: [set() for _ in range(len(gdf))] for key, gdf in metric_layers.items()}
+    dropped = {}
+    trimmed = {}
+    unique_m = {}
+
+    # buffered geometries of everything kept so far, with the layer/row they came from
+    reference = []
+    reference_owner = []
+    for key, gdf in metric_layers.items():
+        geoms = gdf.geometry.values.copy()
+        keep = np.ones(len(gdf), dtype=bool)
+        trimmed[key] = 0
+        if reference:
+            reference_geoms = np.asarray(reference)
+            tree = shapely.STRtree(reference_geoms)
+            pairs = tree.query(geoms, predicate="intersects")
+            for i, hits in pd.Series(pairs[1]).groupby(pairs[0]):
+                geom = geoms[i]
+                if shapely.length(geom) == 0:
+                    continue
+                covered_by = shapely.union_all(reference_geoms[hits.values])
+                # stretches running along a kept trail; shorter overlaps are crossings and junctions,
+                # which stay so the trail isn't cut where it meets another
+                covered = shapely.get_parts(shapely.intersection(geom, covered_by))
+                covered = covered[shapely.get_type_id(covered) == 1]
+                covered_m = shapely.length(covered)
+                along = (covered_m > 3 * tolerance_m) | (covered_m >= shapely.length(geom) - 0.01)
+                if not along.any():
+                    continue
+                pieces = np.concatenate([
+                    shapely.get_parts(shapely.difference(geom, covered_by)),
+                    covered[~along],
+                ])
+                pieces = shapely.get_parts(shapely.line_merge(shapely.multilinestrings(pieces)))
+                # slivers left along the buffer edge
+                parts = pieces[shapely.length(pieces) >= tolerance_m]
+
+                # credit the reference segment that covers most of it
+                overlap = shapely.length(shapely.intersection(geom, reference_geoms[hits.values]))
+                owner_key, owner_row = reference_owner[hits.values[int(np.argmax(overlap))]]
+                also_in[owner_key][owner_row].add(key)
+                if len(parts) == 0:
+                    keep[i] = False
+                    also_in[owner_key][owner_row].update(also_in[key][i])
+                else:
+                    geoms[i] = shapely.multilinestrings(parts) if len(parts) > 1 else parts[0]
+                    trimmed[key] += 1
+
+        dropped[key] = int((~keep).sum())
+        kept_rows = np.flatnonzero(keep)
+        unique_m[key] = float(shapely.length(geoms[kept_rows]).sum())
+        reference.extend(shapely.buffer(geoms[kept_rows], tolerance_m))
+        reference_owner.extend((key, row) for row in kept_rows)
+        metric_layers[key] = gdf.set_geometry(geoms).assign(_keep=keep)
+
+    result = {}
+    for key, gdf in metric_layers.items():
+        gdf = gdf.assign(also_in=[", ".join(sorted(keys)) or None for keys in also_in[key]])
+        gdf = gdf[gdf["_keep"]].drop(columns="_keep")
+        result[key] = gdf.to_crs(layers[key].crs)
+    return result, dropped, trimmed, unique_m
+
+
+def merge_connected_lines(gdf, name_field=None):
+    """Merge segments that meet end to end into longer lines.
+
+    Segments are only merged within the same name_field value (all unnamed
+    segments form one group), so named trails stay separately searchable.
+    The "also_in" values of the merged segments are combined. Other
+    attributes are dropped.
+    """
+    if gdf.empty:
+        return gdf
+
+    names = gdf[name_field].fillna("") if name_field in gdf.columns else pd.Series("", index=gdf.index)
+    also_in = gdf["also_in"] if "also_in" in gdf.columns else pd.Series(None, index=gdf.index, dtype=object)
+
+    rows = []
+    for name, group in gdf.groupby(names.values, sort=False):
+        # no noding: segments only join where they share an end point, crossings stay as they are
+        merged = shapely.line_merge(shapely.multilinestrings(shapely.get_parts(group.geometry.values)))
+        group_also_in = sorted({
+            value for values in also_in.loc[group.index].dropna() for value in values.split(", ")
+        })
+        for part in shapely.get_parts(merged):
+            rows.append({
+                "name": name or None,
+                "also_in": ", ".join(group_also_in) or None,
+                "geometry": part,
+            })
+
+    merged = gpd.GeoDataFrame(rows, geometry="geometry", crs=gdf.crs)
+    if name_field is not None:
+        merged = merged.rename(columns={"name": name_field})
+    else:
+        merged = merged.drop(columns="name")
+    return merged
+
+
+def conflate_trails(layers, name_fields=None, tolerance_m=10, metric_crs="EPSG:32610"):
+    """Deduplicate overlapping trail layers and merge each one's connected segments.
+
+    layers is a dict of layer key -> line GeoDataFrame in priority order
+    (see drop_duplicate_segments); name_fields maps a layer key to candidate
+    name columns, the first one present is used to keep differently named
+    trails apart when merging. Raises ValueError if a layer draws less
+    length after merging than it contributed uniquely, i.e. a trail was
+    lost. Returns the conflated layers and a list of per-layer feature,
+    vertex and length counts before and after.
+    """
+    start = time.perf_counter()
+    name_fields = name_fields or {}
+    before = {key: _layer_counts(gdf) for key, gdf in layers.items()}
+
+    deduplicated, dropped, trimmed, unique_m = drop_duplicate_segments(layers, tolerance_m, metric_crs)
+
+    result = {}
+    stats = []
+    for key, gdf in deduplicated.items():
+        name_field = next((f for f in name_fields.get(key, []) if f in gdf.columns), None)
+        result[key] = merge_connected_lines(gdf, name_field)
+        features, vertices = _layer_counts(result[key])
+        rendered_m = float(shapely.length(result[key].to_crs(metric_crs).geometry.values).sum())
+        # merging only joins lines, so anything short of the unique input length was lost (1 m for rounding)
+        if rendered_m < unique_m[key] - 1.0:
+            raise ValueError(f"{key}: conflated trails draw {rendered_m:.0f} m of {unique_m[key]:.0f} m unique length")
+        stats.append({
+            "layer": key,
+            "tolerance_m": tolerance_m,
+            "features_before": before[key][0],
+            "features_after": features,
+            "duplicates_dropped": dropped[key],
+            "segments_trimmed": trimmed[key],
+            "unique_length_m": round(unique_m[key], 1),
+            "rendered_length_m": round(rendered_m, 1),
+            "vertices_before": before[key][1],
+            "vertices_after": vertices,
+        })
+        print(f"{key}: {before[key][0]} -> {features} features ({dropped[key]} duplicates, {trimmed[key]} trimmed), "
+              f"{before[key][1]} -> {vertices} vertices")
+
+    print(f"conflated {len(layers)} trail layers in {time.perf_counter() - start:.1f}s")
+    return result, stats
@@ -0,0 +1,119 @@
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import geopandas as gpd
+import shapely
+from shapely.geometry import box
+
+# web mercator half-width in metres
+ORIGIN_SHIFT = 2 * math.pi * 6378137 / 2.0
+TILE_EXTENT = 4096
+# clip buffer around each tile, in tile units, so lines don't show seams at tile edges
+TILE_BUFFER = 64
+
+# layers in EPSG:3857 for the tile workers, set once per process by _init_worker
+_worker_layers = {}
+
+
+def tile_bounds(z, x, y):
+    """web mercator bounds (minx, miny, maxx, maxy) of an XYZ tile"""
+    tile_size = 2 * ORIGIN_SHIFT / 2 ** z
+    minx = -ORIGIN_SHIFT + x * tile_size
+    maxy = ORIGIN_SHIFT - y * tile_size
+    return minx, maxy - tile_size, minx + tile_size, maxy
+
+
+def tile_range(bounds, z):
+    """XYZ tile columns and rows covering web mercator bounds at zoom z"""
+    tile_size = 2 * ORIGIN_SHIFT / 2 ** z
+    max_index = 2 ** z - 1
+    x0 = max(0, int((bounds[0] + ORIGIN_SHIFT) // tile_size))
+    x1 = min(max_index, int((bounds[2] + ORIGIN_SHIFT) // tile_size))
+    y0 = max(0, int((ORIGIN_SHIFT - bounds[3]) // tile_size))
+    y1 = min(max_index, int((ORIGIN_SHIFT - bounds[1]) // tile_size))
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _init_worker(layers):
+    global _worker_layers
+    _worker_layers = layers
+
+
+def _render_tile_block(z, xs, ys, out_dir):
+    """encode every tile in a block of columns for all layers, returns the number written"""
+    import mapbox_vector_tile
+
+    written = 0
+    for name, gdf in _worker_layers.items():
+        for x in xs:
+            for y in ys:
+                bounds = tile_bounds(z, x, y)
+                tile_size = bounds[2] - bounds[0]
+                pad = tile_size * TILE_BUFFER / TILE_EXTENT
+                clip_box = box(bounds[0] - pad, bounds[1] - pad, bounds[2] + pad, bounds[3] + pad)
+
+                hits = gdf.sindex.query(clip_box, predicate="intersects")
+                if len(hits) == 0:
+                    continue
+
+                geoms = shapely.clip_by_rect(gdf.geometry.values[hits], *clip_box.bounds)
+                # anything smaller than one tile unit is lost in quantization anyway
+                geoms = shapely.simplify(geoms, tile_size / TILE_EXTENT, preserve_topology=True)
+                features = [
+                    {"geometry": geom, "properties": {}}
+                    for geom in geoms
+                    if geom is not None and not geom.is_empty
+                ]
+                if not features:
+                    continue
+
+                tile = mapbox_vector_tile.encode(
+                    [{"name": name, "features": features}],
+                    default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT},
+                )
+                tile_path = Path(out_dir) / name / str(z) / str(x) / f"{y}.pbf"
+                tile_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tile_path, "wb") as f:
+                    f.write(tile)
+                written += 1
+    return written
+
+
+def build_vector_tiles(layers, out_dir, min_zoom=6, max_zoom=14, max_workers=None, block_size=8):
+    """Cut layers into a directory of MVT tiles, {out_dir}/{layer}/{z}/{x}/{y}.pbf.
+
+    layers is a dict of layer name -> GeoDataFrame. Work is split into blocks
+    of block_size tile columns per zoom level and encoded in a process pool.
+    Returns a dict of zoom -> number of tiles written.
+    """
+    start = time.perf_counter()
+    layers = {
+        name: gdf[["geometry"]].to_crs("EPSG:3857")
+        for name, gdf in layers.items()
+        if gdf is not None and not gdf.empty
+    }
+    bounds = gpd.GeoSeries(
+        [box(*gdf.total_bounds) for gdf in layers.values()], crs="EPSG:3857"
+    ).total_bounds
+
+    blocks = []
+    for z in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_range(bounds, z)
+        for i in range(0, len(xs), block_size):
+            blocks.append((z, xs[i:i + block_size], ys))
+
+    tiles_per_zoom = {z: 0 for z in range(min_zoom, max_zoom + 1)}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(layers,)) as executor:
+        futures = {
+            executor.submit(_render_tile_block, z, xs, ys, os.fspath(out_dir)): z
+            for z, xs, ys in blocks
+        }
+        for future in as_completed(futures):
+            tiles_per_zoom[futures[future]] += future.result()
+
+    print(f"wrote {sum(tiles_per_zoom.values())} tiles for {len(layers)} layers "
+          f"in {time.perf_counter() - start:.1f}s")
+    return tiles_per_zoom
@@ -2,14 +2,31 @@ import pandas as pd
 import geopandas as gpd
 import requests
 import json
-from shapely.geometry import Point
 import plotly.graph_objects as go
 import os
-from sqlalchemy import create_engine, inspect, text
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, create_engine, inspect, make_url, text
+from sqlalchemy.pool import QueuePool
 import folium
 import json
 from dotenv import load_dotenv
 import numpy as np
+from map_output import quantize_layers
+from build_stats import start_run, stage, write_report
+from stream_reader import read_streamed
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # other sources
 # ecology surface water standards
@@ -92,18 +109,112 @@ def fetch_ppov_geojson():
         print(f"Error fetching GeoJSON: {e}")
         return None
     
-def get_table_data(table_name, selected_site=None, parameter=None):
-    # get connection information
-    load_dotenv()
-    DATABASE_URL = os.environ.get("DATABASE_URL")
-    USERNAME_PASSWORD_PAIRS = os.environ.get("USERNAME_PASSWORD_PAIRS")
-    USERNAME_PASSWORD_PAIRS = [tuple(pair.split(":")) for pair in USERNAME_PASSWORD_PAIRS.split(",")]
-    SECRET_KEY = os.environ.get("SECRET_KEY")
-
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL is not set.")
-    # SQLAlchemy engine
-    engine = create_engine(DATABASE_URL)
+# one pooled engine per process, created on first use by get_engine
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+_engine = None
+_engine_lock = threading.Lock()
+
+# incremental site sync (sync_sites): cached site layer, its basin joins, and the
+# site table column that records when a row last changed
+SITES_CACHE = "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/sites.parquet"
+SITE_BASINS_CACHE = "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/site_basins.parquet"
+SITE_WATERMARK_COLUMN = "updated_at"
+
+# get_table_data results kept in memory, keyed on (table, site, parameter)
+QUERY_CACHE_TTL = 300
+QUERY_CACHE_SIZE = 4096
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+# sites per query in get_table_data_batch, well under SQLite's and PostgreSQL's bind parameter limits
+BATCH_QUERY_CHUNK = 500
+
+# rows per chunk in iter_table_data
+STREAM_CHUNK_SIZE = 50_000
+
+
+def get_engine(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True, pool_recycle=1800):
+    """Shared SQLAlchemy engine for DATABASE_URL, built once and reused by every query.
+
+    Connections are pooled (pool_size kept open, up to max_overflow more
+    under load); pool_pre_ping checks a connection before handing it out so
+    ones dropped by the server are replaced instead of failing the query,
+    and pool_recycle reopens connections older than that many seconds.
+    pool_size and max_overflow only apply to dialects that use a QueuePool
+    (not e.g. an in-memory sqlite:// stand-in).
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            load_dotenv()
+            DATABASE_URL = os.environ.get("DATABASE_URL")
+            if not DATABASE_URL:
+                raise ValueError("DATABASE_URL is not set.")
+            url = make_url(DATABASE_URL)
+            options = {"pool_pre_ping": pool_pre_ping, "pool_recycle": pool_recycle}
+            if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+                options.update(pool_size=pool_size, max_overflow=max_overflow)
+            _engine = create_engine(url, **options)
+        return _engine
+
+
+def dispose_engine():
+    """close the pooled connections, e.g. before forking workers or after changing DATABASE_URL"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+def _cache_get(key):
+    """a copy of a cached, unexpired query result, or None"""
+    with _query_cache_lock:
+        cached = _query_cache.get(key)
+        if cached is None or time.monotonic() - cached[0] >= QUERY_CACHE_TTL:
+            return None
+        _query_cache.move_to_end(key)
+        return cached[1].copy()
+
+
+def _cache_put(key, df):
+    with _query_cache_lock:
+        _query_cache[key] = (time.monotonic(), df)
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+
+def invalidate_table_cache(table_name=None, selected_site=None):
+    """Drop cached get_table_data results after writing to the database.
+
+    With no arguments the whole cache is cleared; otherwise only entries
+    for table_name and/or selected_site (any parameter) are dropped.
+    """
+    with _query_cache_lock:
+        if table_name is None and selected_site is None:
+            _query_cache.clear()
+            return
+        for key in list(_query_cache):
+            if (table_name is None or key[0] == table_name) and (selected_site is None or key[1] == selected_site):
+                del _query_cache[key]
+
+
+def get_table_data(table_name, selected_site=None, parameter=None, use_cache=True):
+    """Read a table, optionally filtered to one site and parameter, through the query cache.
+
+    Results are kept for QUERY_CACHE_TTL seconds, least recently used first
+    out once there are more than QUERY_CACHE_SIZE; callers get their own
+    copy so they can modify it. use_cache=False always queries and refreshes
+    the cached result.
+    """
+    key = (table_name, selected_site, parameter)
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+
     if selected_site == None:
         base_query = f'SELECT * FROM "{table_name}"'
         params = None
@@ -119,38 +230,295 @@ def get_table_data(table_name, selected_site=None, parameter=None):
 
     query = text(base_query)
 
-    with engine.connect() as conn:
+    with get_engine().connect() as conn:
         if params == None:
             df = pd.read_sql(query, conn)
         else:
             df = pd.read_sql(query, conn, params=params)
 
-    return df
+    _cache_put(key, df)
+    return df.copy()
+
+
+def get_table_data_batch(table_name, sites, parameters=None, group_by_site=False, chunk_size=BATCH_QUERY_CHUNK,
+                         use_cache=True):
+    """Read many sites in one round trip instead of one get_table_data call per site.
+
+    Sites (and parameters, a list or a single name) are bound as expanding
+    IN lists, so it runs the same on PostgreSQL and a SQLite stand-in;
+    site lists longer than chunk_size are split over several queries to
+    stay under the driver's bind parameter limit. Results share the
+    get_table_data cache per (table, site, parameter), so only sites with
+    something missing are queried. Returns one frame, or a dict of frames
+    per requested site (empty for sites without rows) with group_by_site.
+    """
+    sites = list(dict.fromkeys(sites))
+    if isinstance(parameters, str):
+        parameters = [parameters]
+    parameter_keys = list(dict.fromkeys(parameters)) if parameters is not None else [None]
+
+    parts = {}
+    missing = []
+    for site in sites:
+        cached = [_cache_get((table_name, site, p)) for p in parameter_keys] if use_cache else [None]
+        if any(df is None for df in cached):
+            missing.append(site)
+        else:
+            parts[site] = cached
+
+    if missing:
+        base_query = f'SELECT * FROM "{table_name}" WHERE site IN :sites'
+        binds = [bindparam("sites", expanding=True)]
+        if parameters is not None:
+            base_query += " AND parameter IN :parameters"
+            binds.append(bindparam("parameters", expanding=True))
+        query = text(base_query).bindparams(*binds)
+
+        fetched = []
+        with get_engine().connect() as conn:
+            for i in range(0, len(missing), chunk_size):
+                params = {"sites": missing[i:i + chunk_size]}
+                if parameters is not None:
+                    params["parameters"] = parameter_keys
+                fetched.append(pd.read_sql(query, conn, params=params))
+        fetched = pd.concat(fetched, ignore_index=True)
+
+        if parameters is None:
+            groups = {(site, None): df for site, df in fetched.groupby("site", sort=False)}
+        else:
+            groups = dict(list(fetched.groupby(["site", "parameter"], sort=False)))
+        for site in missing:
+            parts[site] = []
+            for p in parameter_keys:
+                df = groups.get((site, p), fetched.iloc[:0]).reset_index(drop=True)
+                _cache_put((table_name, site, p), df)
+                parts[site].append(df)
+
+    if group_by_site:
+        return {site: pd.concat(parts[site], ignore_index=True) for site in sites}
+    frames = [df for site in sites for df in parts[site]]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# arrow types for the python types SQLAlchemy reports for a table's columns
+SQL_ARROW_TYPES = {
+    int: pa.int64(),
+    float: pa.float64(),
+    Decimal: pa.float64(),  # read_sql coerces decimals to float
+    bool: pa.bool_(),
+    str: pa.string(),
+    bytes: pa.binary(),
+    datetime.datetime: pa.timestamp("us"),
+    datetime.date: pa.date32(),
+}
+
+
+def _arrow_schema(table_name, columns=None, dtypes=None):
+    """Arrow schema of a table's columns (default: all), from the declared dtypes where given,
+    else the database's column types; unknown types are read as strings"""
+    table_types = {column["name"]: column["type"] for column in inspect(get_engine()).get_columns(table_name)}
+    dtypes = dtypes or {}
+    fields = []
+    # the same default column selection as iter_table_data
+    for name in columns or list(dtypes) or table_types:
+        try:
+            arrow_type = SQL_ARROW_TYPES.get(table_types[name].python_type, pa.string())
+        except (KeyError, NotImplementedError):
+            arrow_type = pa.string()
+        if name in dtypes and str(dtypes[name]) == "category":
+            # int32 indices so later chunks can bring more categories than the first one
+            arrow_type = pa.dictionary(pa.int32(), arrow_type)
+        elif name in dtypes:
+            empty = pd.DataFrame({name: pd.Series([], dtype=dtypes[name])})
+            declared = pa.Schema.from_pandas(empty, preserve_index=False).field(name).type
+            if declared != pa.null():
+                arrow_type = declared
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def iter_table_data(table_name, columns=None, dtypes=None, selected_site=None, parameter=None,
+                    chunksize=STREAM_CHUNK_SIZE, arrow=False):
+    """Yield a table in chunks of chunksize rows instead of loading it whole.
+
+    Only columns are selected (default: the keys of dtypes, else all) and
+    dtypes ({column: dtype}, e.g. {"site": "category", "value": "float32"})
+    are applied to each chunk as it is read, so pandas does not have to
+    infer object columns. The query runs on a server-side cursor
+    (stream_results) so the driver does not buffer the full result either.
+    Yields DataFrames, or pyarrow RecordBatches with arrow=True that all
+    share one schema (see _arrow_schema). Bypasses the get_table_data cache.
+    """
+    columns = columns or (list(dtypes) if dtypes else None)
+    select = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+    base_query = f'SELECT {select} FROM "{table_name}"'
+    conditions = []
+    params = {}
+    if selected_site is not None:
+        conditions.append("site = :site")
+        params["site"] = selected_site
+    if parameter is not None:
+        conditions.append("parameter = :parameter")
+        params["parameter"] = parameter
+    if conditions:
+        base_query += " WHERE " + " AND ".join(conditions)
+    query = text(base_query)
+    # fixed up front, so a column that is all null in one chunk doesn't change type between batches
+    schema = _arrow_schema(table_name, columns, dtypes) if arrow else None
+
+    with get_engine().connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        for chunk in pd.read_sql(query, conn, params=params or None, chunksize=chunksize, dtype=dtypes):
+            if arrow:
+                yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+            else:
+                yield chunk
 
-def site_import(parameter = None):
-    """import sites, filters converts to gef exports"""
-    # 1. Load sites data
-    sites = get_table_data("site")
-    # paramters to list  not actually needed because you can read a string but this is better
-    sites['parameter'] = sites['parameter'].apply(lambda x: json.loads(x) if x != '[]' else [])
-    # filter sites by parameter if provided
-    if parameter != "None":
-        sites = sites[sites['parameter'].apply(lambda x: parameter in x if isinstance(x, list) else False)]
-    
-    # sites location processing
-    sites['coordinates'] = sites['location'].apply(json.loads)
-    sites['latitude'] = sites['coordinates'].apply(lambda x: x[0])
-    sites['longitude'] = sites['coordinates'].apply(lambda x: x[1])
-    sites = sites.drop('coordinates', axis=1)
 
-    site_points = [Point(lon, lat) for lon, lat in zip(sites['longitude'], sites['latitude'])]
+def table_data_to_parquet(table_name, parquet_path, columns=None, dtypes=None, selected_site=None, parameter=None,
+                          chunksize=STREAM_CHUNK_SIZE):
+    """Stream a table into a local parquet file chunk by chunk (see iter_table_data) and return the rows written"""
+    start = time.perf_counter()
+    Path(parquet_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{parquet_path}.tmp"
+    rows = 0
+    try:
+        # an empty result still leaves a valid, empty file with the table's columns behind
+        with pq.ParquetWriter(tmp_path, _arrow_schema(table_name, columns, dtypes)) as writer:
+            for batch in iter_table_data(table_name, columns, dtypes, selected_site, parameter, chunksize, arrow=True):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, parquet_path)
+    print(f"streamed {rows} rows from {table_name} in {time.perf_counter() - start:.1f}s")
+    return rows
+
+def _json_column(values, empty="null"):
+    """decode a column of json strings with one parser call instead of one per row"""
+    values = values.where(values.notna(), empty).astype(str).tolist()
+    return _json_loads("[" + ",".join(values) + "]")
+
+def _explode_parameters(parameter_lists):
+    """one categorical row per (site row, parameter), indexed like the sites"""
+    return parameter_lists.explode().dropna().astype("category")
+
+def _sites_to_gdf(sites):
+    """parse the site table's json parameter and location columns into a point GeoDataFrame"""
+    # paramters to list  not actually needed because you can read a string but this is better
+    sites['parameter'] = pd.Series(_json_column(sites['parameter'], empty="[]"), index=sites.index, dtype=object)
+
+    # sites location processing, [latitude, longitude] with an optional elevation after them;
+    # one fixed width row per site so odd rows can't shift or break the others
+    coordinates = np.full((len(sites), 2), np.nan)
+    bad_locations = 0
+    for i, location in enumerate(_json_column(sites['location'])):
+        if location is None:
+            continue
+        try:
+            latitude, longitude = location[:2]
+            coordinates[i] = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            bad_locations += 1
+    if bad_locations:
+        print(f"skipping {bad_locations} sites with an unreadable location")
+    sites['latitude'] = coordinates[:, 0]
+    sites['longitude'] = coordinates[:, 1]
+
+    site_points = gpd.points_from_xy(sites['longitude'], sites['latitude'])
     sites_gdf = gpd.GeoDataFrame(sites, geometry=site_points, crs='EPSG:4326')
 
     # drop columns
-    sites_gdf = sites_gdf.dropna(subset=['longitude', 'latitude', 'location'])
+    return sites_gdf.dropna(subset=['longitude', 'latitude', 'location'])
+
+def site_import(parameter = None):
+    """import sites, filters converts to gef exports"""
+    # 1. Load sites data
+    sites_gdf = _sites_to_gdf(get_table_data("site"))
+    # filter sites by parameter if provided
+    if parameter not in (None, "None"):
+        parameters = _explode_parameters(sites_gdf['parameter'])
+        sites_gdf = sites_gdf[sites_gdf.index.isin(parameters.index[parameters == parameter])]
     sites_gdf.to_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/sites.geojson", driver="GeoJSON")
     return sites_gdf
 
+def _read_sync_state(cache_path):
+    state_path = f"{Path(cache_path).with_suffix('')}_sync.json"
+    if not os.path.exists(state_path) or not os.path.exists(cache_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _last_change(rows, watermark_column):
+    """(watermark, site) of the most recently changed row, or None when there are no rows with a watermark"""
+    rows = rows.dropna(subset=[watermark_column])
+    if rows.empty:
+        return None
+    last = rows.sort_values([watermark_column, "site"]).iloc[-1]
+    return last[watermark_column], last["site"]
+
+def _write_sync_state(cache_path, watermark_column, last_change):
+    watermark, site = last_change
+    if isinstance(watermark, pd.Timestamp):
+        state = {"column": watermark_column, "value": watermark.isoformat(), "type": "timestamp"}
+    else:
+        state = {"column": watermark_column, "value": watermark.item() if hasattr(watermark, "item") else watermark, "type": "value"}
+    state["site"] = site.item() if hasattr(site, "item") else site
+    state["synced"] = pd.Timestamp.now().isoformat(timespec="seconds")
+    with open(f"{Path(cache_path).with_suffix('')}_sync.json", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+def sync_sites(cache_path=SITES_CACHE, watermark_column=SITE_WATERMARK_COLUMN, full=False):
+    """Bring the cached site layer up to date with only the rows changed since the last sync.
+
+    The site table needs a last-modified timestamp or row version column
+    (watermark_column). The previous sync saved the watermark and site key
+    of the last row it saw; rows after that (a later watermark, or the same
+    watermark and a later site key) are fetched and parsed, sites no longer
+    in the table are dropped, and the cached GeoParquet layer is patched
+    with both. Rows without a watermark are only picked up by a full
+    reload, which the first run, a different watermark column or full=True
+    does. Returns (sites_gdf, changed_sites, deleted_sites); pass the two
+    sets to update_site_basins.
+    """
+    state = None if full else _read_sync_state(cache_path)
+    if state is None or state["column"] != watermark_column or "site" not in state:
+        sites = get_table_data("site", use_cache=False)
+        if watermark_column not in sites:
+            raise ValueError(f"site table has no {watermark_column} column to sync on")
+        sites_gdf = _sites_to_gdf(sites)
+        last_change = _last_change(sites, watermark_column)
+        changed, deleted = set(sites["site"]), set()
+    else:
+        watermark = pd.Timestamp(state["value"]).to_pydatetime() if state["type"] == "timestamp" else state["value"]
+        query = text(
+            f'SELECT * FROM "site" WHERE "{watermark_column}" > :watermark '
+            f'OR ("{watermark_column}" = :watermark AND site > :site)'
+        )
+        with get_engine().connect() as conn:
+            updated = pd.read_sql(query, conn, params={"watermark": watermark, "site": state["site"]})
+            current = pd.read_sql(text('SELECT site FROM "site"'), conn)["site"]
+
+        cached = gpd.read_parquet(cache_path)
+        changed = set(updated["site"])
+        deleted = set(cached["site"]) - set(current)
+        kept = cached[~cached["site"].isin(changed | deleted)]
+        if not updated.empty:
+            sites_gdf = pd.concat([kept, _sites_to_gdf(updated)], ignore_index=True)
+        else:
+            sites_gdf = kept.reset_index(drop=True)
+        last_change = _last_change(updated, watermark_column)
+
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    sites_gdf.to_parquet(cache_path)
+    # nothing new (or an empty table): keep the previous watermark
+    if last_change is not None:
+        _write_sync_state(cache_path, watermark_column, last_change)
+    invalidate_table_cache("site")
+    print(f"synced sites: {len(changed)} changed, {len(deleted)} deleted, {len(sites_gdf)} total")
+    return sites_gdf, changed, deleted
+
 def watershed_import():
     if os.path.exists("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/watersheds.geojson"):
         print("watersheds exists") #print("Clipped file already exists!")
@@ -188,6 +556,21 @@ def site_basin(sites_gdf, watersheds):
         #else:
         #    return sites_gdf
         
+def update_site_basins(sites_gdf, watersheds, changed, deleted=(), cache_path=SITE_BASINS_CACHE):
+        """Recompute site_basin for the changed sites only and patch the cached result (see sync_sites).
+
+        Without a cached result every site is joined.
+        """
+        if os.path.exists(cache_path):
+            site_basins = gpd.read_parquet(cache_path)
+            site_basins = site_basins[~site_basins["site"].isin(set(changed) | set(deleted))]
+            fresh = site_basin(sites_gdf[sites_gdf["site"].isin(changed)], watersheds)
+            site_basins = pd.concat([site_basins, fresh], ignore_index=True)
+        else:
+            site_basins = site_basin(sites_gdf, watersheds)
+        site_basins.to_parquet(cache_path)
+        return site_basins
+        
 def watershed_condition(sites_gdf, census_gdf, watersheds):
         """adds watershed environmental_condition to site watersheds, uses basin"""
         """ this is partially redundent since I am using the environmental condition gdf for the watersheds layer but i want to use a different watersheds layer"""
@@ -298,12 +681,15 @@ def filter_nhd_waterbodies(sites_gdf, watersheds):
     
     #else:
         print("import nhd water bodies")
-        # Set environment variable and process
-        os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-        nhd_waterbodies = gpd.read_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/wa_nhd_waterbodies.geojson")
-        # Ensure same CRS
-        if nhd_waterbodies.crs != site_watersheds.crs:
-            nhd_waterbodies = nhd_waterbodies.to_crs(site_watersheds.crs)
+        # statewide file: stream it in batches, keeping only the columns used below
+        # and waterbodies touching the watersheds, reprojected per batch
+        nhd_waterbodies = read_streamed(
+            "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/wa_nhd_waterbodies.geojson",
+            columns=["OBJECTID", "Elevation", "ReachCode"],
+            mask=watersheds.geometry.union_all(),
+            mask_crs=watersheds.crs,
+            crs=watersheds.crs,
+        )
         print("origiona waterbodies")
         print(nhd_waterbodies)
 
@@ -333,12 +719,15 @@ def filter_riparian_sun(site_watersheds):
         
         
     else:
-        # Set environment variable and process
-        os.environ['OGR_GEOJSON_MAX_OBJ_SIZE'] = '0'
-        full_gdf = gpd.read_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/king_county_fema_floodplain_100yr_area.geojson")
-        # Ensure same CRS
-        if full_gdf.crs != site_watersheds.crs:
-            full_gdf = full_gdf.to_crs(site_watersheds.crs)
+        # stream the floodplain in batches, clipped to the site watersheds and
+        # reprojected per batch, so the full county layer is never in memory
+        full_gdf = read_streamed(
+            "C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/king_county_fema_floodplain_100yr_area.geojson",
+            mask=site_watersheds.geometry.union_all(),
+            mask_crs=site_watersheds.crs,
+            crs=site_watersheds.crs,
+            clip=True,
+        )
         # Clip and save
         clipped_gdf = full_gdf.clip(site_watersheds)
         clipped_gdf.to_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/king_county_fema_floodplain_100yr_area_clipped.geojson", driver="GeoJSON")
@@ -591,12 +980,36 @@ def filter_percent_pov(site_watersheds):
     # Return watersheds with stats and the clipped poverty data
     return site_watersheds, ppov_clipped
 
-def create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf = None, cso_gdf = None, wtd_service_area = None, nhd_centerlines = None, nhd_waterbodies = None):
+def create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf = None, cso_gdf = None, wtd_service_area = None, nhd_centerlines = None, nhd_waterbodies = None, coordinate_decimals = None, renderer = "svg"):
     import folium
     import matplotlib.pyplot as plt
     from matplotlib.colors import LinearSegmentedColormap
     import matplotlib.colors as mcolors
 
+    # round embedded coordinates, see map_output.quantize_layers
+    quantize_stats = []
+    if coordinate_decimals is not None:
+        quantized, quantize_stats = quantize_layers({
+            'Sites': sites_gdf,
+            'All Watersheds': watersheds,
+            'Site Watersheds': site_watersheds,
+            'Census Tracks': census_gdf,
+            'CAO Data': cao_gdf,
+            'CSO Points': cso_gdf,
+            'WTD Service Area': wtd_service_area,
+            'NHD Streams': nhd_centerlines,
+            'NHD Waterbodies': nhd_waterbodies,
+        }, coordinate_decimals)
+        sites_gdf = quantized['Sites']
+        watersheds = quantized['All Watersheds']
+        site_watersheds = quantized['Site Watersheds']
+        census_gdf = quantized['Census Tracks']
+        cao_gdf = quantized['CAO Data']
+        cso_gdf = quantized['CSO Points']
+        wtd_service_area = quantized['WTD Service Area']
+        nhd_centerlines = quantized['NHD Streams']
+        nhd_waterbodies = quantized['NHD Waterbodies']
+
     # assign color values
     def get_color_from_value(value, min_val, max_val, colormap='YlOrRd'):
         """Get hex color from value using matplotlib colormap"""
@@ -624,7 +1037,9 @@ def create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf = Non
         tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
         attr='Esri',
         zoom_control=True,
-        scrollWheelZoom=True
+        scrollWheelZoom=True,
+        # "canvas" draws every vector layer into one canvas instead of an svg path each
+        prefer_canvas=renderer == 'canvas'
     )
 
         # Add a rectangle showing your bounds for context
@@ -640,7 +1055,8 @@ def create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf = Non
             zoom_start=10,
             tiles=None,
             zoom_control=True,
-            scrollWheelZoom=True
+            scrollWheelZoom=True,
+            prefer_canvas=renderer == 'canvas'
         )
         
         #tiles_group = folium.FeatureGroup(name="Basemaps")
@@ -976,6 +1392,7 @@ def create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf = Non
     
     # sites
     
+    m.quantize_stats = quantize_stats
     return m
 def create_map_plotly(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf=None, cso_gdf=None, 
                wtd_service_area=None, nhd_centerlines=None, nhd_waterbodies=None):
@@ -1443,25 +1860,54 @@ if __name__ == '__main__':
     # import sites
     # import local sites
 
-    sites_gdf =  gpd.read_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/sites.geojson")
+    # per-stage time/memory report, written to build_stats.REPORT_DIR at the end
+    start_run("watershed_gis")
+
+    # pull only the sites changed since the last run from the database (sync_sites)
+    # instead of reading the last site_import export
+    sync_from_database = False
+    with stage("import sites") as s:
+        if sync_from_database:
+            sites_gdf, changed_sites, deleted_sites = sync_sites()
+            s.info["changed_sites"] = len(changed_sites)
+        else:
+            sites_gdf = gpd.read_file("C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/sites.geojson")
+        s.count(sites_gdf)
     #sites_gdf = site_import(parameter = "discharge")
     
     # import
     # Process sites with watersheds
-    watersheds = watershed_import()
-    cso_gdf, watersheds = filter_cso_points(watersheds, buffer_distance = 1000)
-    wtd_service_area, watersheds = wtd_service_area(watersheds)
-
-    sites_gdf = site_basin(sites_gdf, watersheds)
-
-    census_gdf = filter_census_data(sites_gdf, watersheds)
-    sites_gdf, watersheds, census_gdf = filter_environmental_health(sites_gdf, watersheds, census_gdf)
-    census_gdf, watersheds = watershed_condition(sites_gdf, census_gdf, watersheds)
-    site_watersheds = filter_watersheds(sites_gdf, watersheds)
+    with stage("import watersheds") as s:
+        watersheds = s.count(watershed_import())
+    with stage("clip cso points") as s:
+        cso_gdf, watersheds = filter_cso_points(watersheds, buffer_distance = 1000)
+        s.count(cso_gdf)
+    with stage("overlay wtd service area") as s:
+        wtd_service_area, watersheds = wtd_service_area(watersheds)
+        s.count(watersheds)
+
+    with stage("join site basins") as s:
+        if sync_from_database:
+            sites_gdf = s.count(update_site_basins(sites_gdf, watersheds, changed_sites, deleted_sites))
+        else:
+            sites_gdf = s.count(site_basin(sites_gdf, watersheds))
+
+    with stage("import census data") as s:
+        census_gdf = s.count(filter_census_data(sites_gdf, watersheds))
+    with stage("join environmental health") as s:
+        sites_gdf, watersheds, census_gdf = filter_environmental_health(sites_gdf, watersheds, census_gdf)
+        s.count(census_gdf)
+    with stage("watershed condition") as s:
+        census_gdf, watersheds = watershed_condition(sites_gdf, census_gdf, watersheds)
+        s.count(watersheds)
+    with stage("filter site watersheds") as s:
+        site_watersheds = s.count(filter_watersheds(sites_gdf, watersheds))
     
     
-    census_site_watersheds =  crop_census_data(census_gdf, site_watersheds)
-    cao_gdf = filter_cao(sites_gdf, site_watersheds)
+    with stage("clip census data") as s:
+        census_site_watersheds = s.count(crop_census_data(census_gdf, site_watersheds))
+    with stage("clip cao data") as s:
+        cao_gdf = s.count(filter_cao(sites_gdf, site_watersheds))
    
     #nhd_centerlines = filter_nhd_centerlines(watersheds)
     #nhd_waterbodies = filter_nhd_waterbodies(sites_gdf, watersheds)
@@ -1471,8 +1917,11 @@ if __name__ == '__main__':
     #m = create_map(sites_gdf, watersheds, site_watersheds, census_site_watersheds, cao_gdf, cso_gdf, wtd_service_area, None, None)
     #m.save('C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/watershed_map.html')
     
-    fig = create_map_plotly(sites_gdf, watersheds, site_watersheds, census_site_watersheds, cao_gdf, cso_gdf, wtd_service_area, None, None)
-    fig.save('C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/WTD_map.html')
+    with stage("create map"):
+        fig = create_map_plotly(sites_gdf, watersheds, site_watersheds, census_site_watersheds, cao_gdf, cso_gdf, wtd_service_area, None, None)
+    with stage("save html"):
+        fig.save('C:/Users/ihiggins/OneDrive - King County/cache_render_gis_data/WTD_map.html')
+    write_report()
     
     #m = create_map(sites_gdf, watersheds, site_watersheds, census_gdf, cao_gdf, cso_gdf, wtd_service_area, nhd_centerlines, nhd_waterbodies)
      # view map